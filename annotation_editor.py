@@ -6,7 +6,9 @@ import json
 from pathlib import Path
 
 import cv2
+import numpy as np
 import os
+import threading
 
 import tkinter as tk
 from tkinter import filedialog
@@ -15,12 +17,15 @@ from tkinter.messagebox import showerror
 
 from PIL import ImageTk
 
-from src.auxiliary import is_point_in_rectangle, Colors, \
-    box_property_to_color, get_image_from_box_fixed_size, open_file_as_tk_image, \
+from src.auxiliary import Colors, \
+    box_property_to_color, open_file_as_tk_image, \
     is_rectangle_big_enough, \
     state_to_json, get_folder_contents, BoxType, BoxesWithType, ListCycle, \
-    BoxManipulationAction, draw_transparent_rectangle, draw_transparent_line
+    BoxManipulationAction
+from src.frame_scheduler import FrameScheduler
+from src.overlay import OverlayCompositor
 from src.programstate import PieceProperties, GuiState, ProgramState
+from src.viewport import Viewport, PagePyramid, render_page_strip
 from src.config import GO_INTO_ANNOTATION_MODE_IMAGE, INVALID_MODE_IMAGE, PLUGIN_NOT_SUPPORT_NOTATION_IMAGE, \
     FULL_ANNOTATION_NAME
 from src.widgets_auxiliary import on_closing, IncrementDecrementFrame, PreviousNextFrame, \
@@ -58,6 +63,7 @@ class MainWindow:
 
             if exit_flag:
                 on_closing(main_window)()
+            return opencv_window.is_frame_changed
 
         def must_be_changed():
             self.program_state.gui_state.must_be_changed = True
@@ -79,6 +85,12 @@ class MainWindow:
             self.program_state.piece_properties.content.reset()
             must_be_changed()
 
+        def on_change_prefetch():
+            if self.program_state.gui_state.tk_segmentation_prefetch.get():
+                self.program_state.prefetch_next_segmentation()
+            else:
+                self.program_state.segmentation_prefetcher.cancel()
+
         def on_previous():
             self.program_state.gui_state.image_name_circle.previous()
             on_reset_segmentation()
@@ -100,7 +112,6 @@ class MainWindow:
             boxes = self.program_state.piece_properties.content
             for idx in range(len(boxes)):
                 self.program_state.gui_state.type_to_cycle_dict[boxes.get_index_type(idx)].append(idx)
-                self.program_state.gui_state.box_idx_to_tkinter_image_dict[idx] = get_image_from_box_fixed_size(self.program_state.gui_state.current_image, boxes.get_index_coordinates(idx))
             for boxtype_var in dataclasses.astuple(BoxType()):
                 self.program_state.gui_state.type_to_cycle_dict[boxtype_var] = ListCycle(self.program_state.gui_state.type_to_cycle_dict[boxtype_var])
 
@@ -200,7 +211,42 @@ class MainWindow:
 
             return notation_img
 
-        def get_complete_notation_image():
+        notation_preview_cache = {}
+        '''dict[stage] -> (fingerprint of the inputs of the stage, output of the stage). The stages of the notation
+        preview are only rendered again if their inputs have changed.'''
+
+        def get_cached(stage, fingerprint, render):
+            cached = notation_preview_cache.get(stage)
+            if cached is None or cached[0] != fingerprint:
+                cached = notation_preview_cache[stage] = (fingerprint, render())
+            return cached[1]
+
+        def get_boxes_fingerprint():
+            # a snapshot of everything the notation image and the metadata are read from (the annotations are dicts
+            # which might be modified in place, so they are serialized)
+            type_to_cycle_dict = self.program_state.gui_state.type_to_cycle_dict
+            return json.dumps([
+                [(box["box_type"], box["annotation"], box["is_line_break"])
+                 for box in self.program_state.piece_properties.content.boxes_list],
+                {key: type_to_cycle_dict[key].list for key in [BoxType.TITLE, BoxType.MODE, BoxType.PREFACE]
+                 if key in type_to_cycle_dict}
+            ], default=str)
+
+        def resize_to_width(pil_image):
+            height, width = pil_image.height, pil_image.width
+            #if width > 600:
+            #    new_width = 600
+            #    new_height = int(new_width * height / width)
+            #    pil_image = pil_image.resize((new_width, new_height))
+            #elif height > 600:
+            #    new_height = 600
+            #    new_width = int(new_height * width / height)
+            #    pil_image = pil_image.resize((new_width, new_height))
+            percentage = 0.5
+            pil_image = pil_image.resize((int(width*percentage), int(height*percentage)))
+            return pil_image
+
+        def get_complete_notation_image_and_fingerprint():
             def get_content_list(key: str):
                 return [self.program_state.piece_properties.content.get_index_annotation(box_idx) for box_idx in
                         self.program_state.gui_state.type_to_cycle_dict[key].list]
@@ -216,24 +262,49 @@ class MainWindow:
                             string += "\n"
                 return string
 
-            mode_str = f"{get_content_string(BoxType.MODE)}"
-            mode = GongdiaoModeList.from_string(self.program_state.gui_state.tk_current_mode_string.get())
-            if mode.final_note is None or mode.gong_lvlv is None:
-                mode_str += f"（{mode.chinese_name}）"
-
-            notation_img = get_notation_image()
+            def get_metadata_image(notation_img):
+                mode_str = f"{get_content_string(BoxType.MODE)}"
+                mode = GongdiaoModeList.from_string(self.program_state.gui_state.tk_current_mode_string.get())
+                if mode.final_note is None or mode.gong_lvlv is None:
+                    mode_str += f"（{mode.chinese_name}）"
+
+                return construct_metadata_image(self.program_state.gui_state.notation_resources.title_font,
+                                                self.program_state.gui_state.notation_resources.small_font,
+                                                get_content_string(BoxType.TITLE),
+                                                mode_str,
+                                                get_content_string(BoxType.PREFACE),
+                                                image_width=notation_img.width,
+                                                is_vertical=display_notes_frame.get_traditional_reading_order())
+
+            def get_combined_image(notation_img, metadata_img):
+                combined_img = horizontal_composition([notation_img, metadata_img]) if display_notes_frame.get_traditional_reading_order() else vertical_composition([metadata_img, notation_img])
+                return add_border(combined_img, 150, 200)
+
+            boxes_fingerprint = get_boxes_fingerprint()
+            mode_string = self.program_state.gui_state.tk_current_mode_string.get()
+            is_vertical = display_notes_frame.get_traditional_reading_order()
+            notation_fingerprint = (boxes_fingerprint, self.program_state.gui_state.tk_current_action.get(),
+                                    self.program_state.gui_state.tk_notation_plugin_selection.get(), mode_string,
+                                    display_notes_frame.get_transposition().name,
+                                    display_notes_frame.get_notation_display_type(), is_vertical)
+
+            notation_img = get_cached("notation", notation_fingerprint, get_notation_image)
             if notation_img is None:
+                return notation_fingerprint, None
+            metadata_fingerprint = (boxes_fingerprint, mode_string, notation_img.width, is_vertical)
+            metadata_img = get_cached("metadata", metadata_fingerprint, lambda: get_metadata_image(notation_img))
+            fingerprint = (notation_fingerprint, metadata_fingerprint)
+            return fingerprint, get_cached("combined", fingerprint, lambda: get_combined_image(notation_img, metadata_img))
+
+        def get_complete_notation_image():
+            return get_complete_notation_image_and_fingerprint()[1]
+
+        def get_notation_preview():
+            fingerprint, complete_notation_img = get_complete_notation_image_and_fingerprint()
+            if complete_notation_img is None:
                 return None
-            metadata_img = construct_metadata_image(self.program_state.gui_state.notation_resources.title_font,
-                                                    self.program_state.gui_state.notation_resources.small_font,
-                                                    get_content_string(BoxType.TITLE),
-                                                    mode_str,
-                                                    get_content_string(BoxType.PREFACE),
-                                                    image_width=notation_img.width,
-                                                    is_vertical=display_notes_frame.get_traditional_reading_order())
-            combined_img = horizontal_composition([notation_img, metadata_img]) if display_notes_frame.get_traditional_reading_order() else vertical_composition([metadata_img, notation_img])
-            combined_img = add_border(combined_img, 150, 200)
-            return combined_img
+            return get_cached("preview", fingerprint,
+                              lambda: ImageTk.PhotoImage(image=resize_to_width(complete_notation_img)))
 
         def save_to_musicxml(file_path):
             def get_content_list(key: str):
@@ -274,8 +345,7 @@ class MainWindow:
 
         def on_save_notation():
             self.main_window.focus_force()
-            draw_image = opencv_window.get_current_draw_image()
-            if draw_image is not None:
+            if opencv_window.base_layer_page_strip is not None:  # some pages are loaded
                 file_path = asksaveasfilename(
                     initialdir=self.program_state.gui_state.output_dir,
                     initialfile=self.program_state.gui_state.initial_filename,
@@ -287,8 +357,7 @@ class MainWindow:
 
         def on_save_musicxml():
             self.main_window.focus_force()
-            draw_image = opencv_window.get_current_draw_image()
-            if draw_image is not None:
+            if opencv_window.base_layer_page_strip is not None:  # some pages are loaded
                 file_path = asksaveasfilename(
                     initialdir=self.program_state.gui_state.output_dir,
                     initialfile=self.program_state.gui_state.initial_filename,
@@ -452,11 +521,19 @@ class MainWindow:
         segment_pages_individually_checkbutton = tk.Checkbutton(segmentation_frame, text='Segment individually',
                                                                 variable=self.program_state.gui_state.tk_segmentation_individual_pages, onvalue=1,
                                                                 offvalue=0, command=must_be_changed)
+        segment_tiled_checkbutton = tk.Checkbutton(segmentation_frame, text='High resolution (tiled)',
+                                                   variable=self.program_state.gui_state.tk_segmentation_tiled, onvalue=1,
+                                                   offvalue=0, command=on_change_prefetch)
+        segment_prefetch_checkbutton = tk.Checkbutton(segmentation_frame, text='Prefetch next pages',
+                                                      variable=self.program_state.gui_state.tk_segmentation_prefetch,
+                                                      onvalue=1, offvalue=0, command=on_change_prefetch)
         segmentation_button = tk.Button(segmentation_frame, text="Auto-Segmentation", command=self.program_state.make_new_segmentation)
         min_bounding_rect = tk.Button(segmentation_frame, text="Min Bounding Rectangles", command=on_min_bounding_rect)
         segmentation_button.grid(row=0, column=0, padx=2)
         min_bounding_rect.grid(row=0, column=1, padx=2)
         segment_pages_individually_checkbutton.grid(row=1, column=0, padx=5)
+        segment_tiled_checkbutton.grid(row=1, column=1, padx=5)
+        segment_prefetch_checkbutton.grid(row=2, column=0, padx=5)
         segmentation_frame.grid(row=0, column=0, padx=5, pady=1)
 
         order_frame = tk.LabelFrame(segmentation_order_frame, text="Box Ordering")
@@ -486,34 +563,18 @@ class MainWindow:
             annotation_frame.set_image(None)
 
         def handle_notation_info():
-            def resize_to_width(pil_image):
-                height, width = pil_image.height, pil_image.width
-                #if width > 600:
-                #    new_width = 600
-                #    new_height = int(new_width * height / width)
-                #    pil_image = pil_image.resize((new_width, new_height))
-                #elif height > 600:
-                #    new_height = 600
-                #    new_width = int(new_height * width / height)
-                #    pil_image = pil_image.resize((new_width, new_height))
-                percentage = 0.5
-                pil_image = pil_image.resize((int(width*percentage), int(height*percentage)))
-                return pil_image
-
             plugin_name = self.program_state.gui_state.tk_notation_plugin_selection.get().lower()
             module = importlib.import_module(f"src.plugins.{plugin_name}")
             curr_action = self.program_state.gui_state.tk_current_action.get()
 
             if module.DISPLAY_NOTATION:
                 if curr_action == BoxManipulationAction.ANNOTATE:
-                    notation_img = get_complete_notation_image()
+                    notation_img = get_notation_preview()
                 else:
                     notation_img = None
 
 
                 if notation_img:
-                    notation_img = resize_to_width(notation_img)
-                    notation_img = ImageTk.PhotoImage(image=notation_img)
                     display_notes_frame.set_image(notation_img)
                 else:
                     display_notes_frame.set_image(plugin_not_support_notation_image)
@@ -529,9 +590,11 @@ class MainWindow:
                 display_notes_frame.set_state(False)
                 display_notes_frame.set_image(plugin_not_support_notation_image)
                 display_notes_frame.configure_musicxml(False)
-        def start_opencv_timer():
-            handle_opencv_window()
-            self.main_window.after(10, start_opencv_timer)
+        # the canvas is redrawn on input and state changes, and only rarely when nothing happens
+        opencv_frame_scheduler = FrameScheduler(self.main_window, handle_opencv_window)
+        opencv_window.on_input = opencv_frame_scheduler.notify
+        self.main_window.bind_all("<Any-KeyPress>", lambda event: opencv_frame_scheduler.notify(), add="+")
+        self.main_window.bind_all("<Any-ButtonRelease>", lambda event: opencv_frame_scheduler.notify(), add="+")
 
         def start_notation_window_timer():
             handle_notation_info()
@@ -559,7 +622,7 @@ class MainWindow:
 
         display_notes_frame.get_frame().grid(row=6, column=1)
 
-        self.main_window.after(1, start_opencv_timer)
+        opencv_frame_scheduler.start()
         self.main_window.after(1, start_notation_window_timer)
 
         def _on_closing():
@@ -577,10 +640,26 @@ class OpenCvWindow:
         self.window_name = window_name
         self.program_state = program_state
         self.current_mouse_coordinates = None
+        self.current_selection_mode = None
+        '''The action of the last frame, the mouse coordinates are forgotten when it changes'''
         self.current_move_box_idx = None
         self.move_direction = None
         self.current_move_box = None
         self.draw_image = None
+        self.viewport = Viewport()
+        '''The visible part of the pages, which can be panned by dragging with the left mouse button and zoomed with
+        the mouse wheel or the keys '+' and '-' ('f' shows all pages)'''
+        self.pyramid = None
+        '''The downscaled pages used for rendering the viewport'''
+        self.pan_start = None
+        self.base_layer = None
+        '''The visible part of the pages with all boxes drawn at window resolution, only redrawn when the viewport,
+        the boxes or their appearance change'''
+        self.base_layer_page_strip = None
+        self.base_layer_signature = None
+        self.current_annotation_idx = None
+        self.overlays = OverlayCompositor()
+        '''The transient overlays (ruler, drag rectangle, order highlights) of the current frame'''
         self.point_1 = None
         self.point_2 = None
         self.is_clicked = False
@@ -588,6 +667,10 @@ class OpenCvWindow:
         self.alt_click = False
         self.segmentation_boxes = BoxesWithType()
         self.new_order = []
+        self.is_frame_changed = False
+        '''True if the last frame changed the canvas or handled a key press'''
+        self.on_input = lambda: None
+        '''Called on every mouse event, e.g., to schedule the next frame'''
 
         cv2.namedWindow(self.window_name, cv2.WINDOW_GUI_NORMAL)
         cv2.resizeWindow(self.window_name, 600, 600)
@@ -597,6 +680,18 @@ class OpenCvWindow:
         cv2.destroyWindow(self.window_name)
 
     def handle_mouse_events(self, event, x, y, flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN:
+            self.pan_start = (x, y)
+        elif event == cv2.EVENT_LBUTTONUP:
+            self.pan_start = None
+        elif event == cv2.EVENT_MOUSEMOVE and self.pan_start is not None and flags & cv2.EVENT_FLAG_LBUTTON:
+            self.viewport.pan(x - self.pan_start[0], y - self.pan_start[1])
+            self.pan_start = (x, y)
+        elif event == cv2.EVENT_MOUSEWHEEL:
+            self.viewport.zoom_at((x, y), 1.25 if cv2.getMouseWheelDelta(flags) > 0 else 0.8)
+
+        x, y = self.viewport.to_image((x, y))  # the box operations work in image coordinates
+
         if event == cv2.EVENT_RBUTTONDOWN:
             self.point_1 = (x, y)
             self.is_clicked = True
@@ -606,18 +701,24 @@ class OpenCvWindow:
                 self.point_2 = (x, y)
             self.is_clicked = False
 
-        if event == cv2.EVENT_MOUSEMOVE:
+        if event in [cv2.EVENT_MOUSEMOVE, cv2.EVENT_RBUTTONDOWN, cv2.EVENT_RBUTTONUP]:
             self.current_mouse_coordinates = (x, y)
 
         self.ctrl_click = flags & cv2.EVENT_FLAG_CTRLKEY
         self.alt_click = flags & cv2.EVENT_FLAG_ALTKEY
 
+        self.on_input()
+
 
     def draw_and_handle_clicks(self, program_state: ProgramState, selection_mode, boxtype, current_image, current_annotation_idx, set_current_annotation_idx = lambda: None):
         self.segmentation_boxes = program_state.piece_properties.content
 
+        if selection_mode != self.current_selection_mode:  # e.g., no ruler at a stale position after switching to CREATE
+            self.current_mouse_coordinates = None
+            self.current_selection_mode = selection_mode
+
         exit_flag = False
-        self.draw_image = copy.deepcopy(current_image)
+        self.overlays.clear()
 
         keypress = cv2.waitKey(1)
 
@@ -625,6 +726,13 @@ class OpenCvWindow:
             program_state.gui_state.main_window.focus_force()
             program_state.gui_state.main_window.event_generate(f"<Control-KeyPress-{chr(keypress)}>")
 
+        if keypress == ord('f'):
+            self.viewport.fit(current_image.shape[1], current_image.shape[0])
+        elif keypress in [ord('+'), ord('=')]:
+            self.viewport.zoom_at((self.viewport.width / 2, self.viewport.height / 2), 1.25)
+        elif keypress == ord('-'):
+            self.viewport.zoom_at((self.viewport.width / 2, self.viewport.height / 2), 0.8)
+
         # exit if q is pressed or the red x button in the window
         if keypress == ord('q'): #or cv2.getWindowProperty(self.window_name, cv2.WND_PROP_VISIBLE) < 1:
             exit_flag = True
@@ -638,12 +746,12 @@ class OpenCvWindow:
 
             if self.current_mouse_coordinates and self.is_clicked:
                 if program_state.piece_properties.content:
-                    for idx, box in enumerate(program_state.piece_properties.content.get_coordinates()):
-                        if idx not in self.new_order and is_point_in_rectangle(self.current_mouse_coordinates, box):
+                    for idx in program_state.piece_properties.content.get_indices_at_point(self.current_mouse_coordinates):
+                        if idx not in self.new_order:
                             self.new_order.append(idx)
             for idx in self.new_order:
                 start, end = program_state.piece_properties.content.get_index_coordinates(idx)
-                self.draw_image = cv2.rectangle(self.draw_image, start, [end[0] - 1, end[1] - 1], Colors.VIOLET, 8)
+                self.overlays.add_rectangle(start, [end[0] - 1, end[1] - 1], Colors.VIOLET, 8)
             if len(self.new_order) == len(program_state.piece_properties.content):
                 program_state.piece_properties.content.reorder(self.new_order)
                 self.new_order = []
@@ -654,38 +762,36 @@ class OpenCvWindow:
         
         if self.current_mouse_coordinates and self.is_clicked and selection_mode in [BoxManipulationAction.MARK, BoxManipulationAction.DELETE, BoxManipulationAction.ORDER, BoxManipulationAction.ANNOTATE]:
             if program_state.piece_properties.content:
-                for idx, box in enumerate(program_state.piece_properties.content.get_coordinates()):
-                    if is_point_in_rectangle(self.current_mouse_coordinates, box):
-                        if selection_mode == BoxManipulationAction.MARK:
-                            if self.ctrl_click:  # if ctrl is clicked, mark all boxes after the current box, too
-                                for all_later_idxs in range(idx, len(program_state.piece_properties.content)):
-                                    program_state.piece_properties.content.set_index_type(all_later_idxs, boxtype)
-                            elif self.alt_click:  # if alt is clicked, mark all boxes in the current column
-                                for all_later_idxs in range(idx, len(program_state.piece_properties.content)):
-                                    program_state.piece_properties.content.set_index_type(all_later_idxs, boxtype)
-                                    if program_state.piece_properties.content.is_index_line_break(all_later_idxs):
-                                        break
-                            else:
-                                program_state.piece_properties.content.set_index_type(idx, boxtype)
-                        if selection_mode == BoxManipulationAction.DELETE:
-                            if self.ctrl_click:
-                                delete_idxs = []
-                                for all_later_idxs in range(idx, len(program_state.piece_properties.content)):
-                                    delete_idxs.append(all_later_idxs)
-                                    if program_state.piece_properties.content.is_index_line_break(all_later_idxs):
-                                        break
-                            else:
-                                program_state.piece_properties.content.delete_index(idx)
-                        if selection_mode == BoxManipulationAction.ANNOTATE:
-                            set_current_annotation_idx(idx)
-                        break
+                idx = program_state.piece_properties.content.get_index_at_point(self.current_mouse_coordinates)
+                if idx is not None:
+                    if selection_mode == BoxManipulationAction.MARK:
+                        if self.ctrl_click:  # if ctrl is clicked, mark all boxes after the current box, too
+                            for all_later_idxs in range(idx, len(program_state.piece_properties.content)):
+                                program_state.piece_properties.content.set_index_type(all_later_idxs, boxtype)
+                        elif self.alt_click:  # if alt is clicked, mark all boxes in the current column
+                            for all_later_idxs in range(idx, len(program_state.piece_properties.content)):
+                                program_state.piece_properties.content.set_index_type(all_later_idxs, boxtype)
+                                if program_state.piece_properties.content.is_index_line_break(all_later_idxs):
+                                    break
+                        else:
+                            program_state.piece_properties.content.set_index_type(idx, boxtype)
+                    if selection_mode == BoxManipulationAction.DELETE:
+                        if self.ctrl_click:
+                            delete_idxs = []
+                            for all_later_idxs in range(idx, len(program_state.piece_properties.content)):
+                                delete_idxs.append(all_later_idxs)
+                                if program_state.piece_properties.content.is_index_line_break(all_later_idxs):
+                                    break
+                        else:
+                            program_state.piece_properties.content.delete_index(idx)
+                    if selection_mode == BoxManipulationAction.ANNOTATE:
+                        set_current_annotation_idx(idx)
 
         program_state.piece_properties.content.delete_multiple_indices(delete_idxs)
 
         if selection_mode == BoxManipulationAction.CREATE:
             if self.point_1 is not None:
-                self.draw_image = draw_transparent_rectangle(self.draw_image, self.point_1, self.current_mouse_coordinates,
-                                                Colors.VIOLET, 1, 0.8)
+                self.overlays.add_rectangle(self.point_1, self.current_mouse_coordinates, Colors.VIOLET, 1, alpha=0.8)
                 if self.point_1 is not None and self.point_2 is not None:
                     if is_rectangle_big_enough([self.point_1, self.point_2]):
                         self.segmentation_boxes.add_rectangle(self.point_1, [self.point_2[0]+1, self.point_2[1]+1], type=boxtype)
@@ -694,31 +800,31 @@ class OpenCvWindow:
             else:  # draw ruler
                 if self.current_mouse_coordinates is not None:
                     current_x, current_y = self.current_mouse_coordinates
-                    self.draw_image = draw_transparent_line(self.draw_image, (current_x-2, current_y), (current_x+60, current_y), Colors.VIOLET, 1, alpha=0.3)
-                    self.draw_image = draw_transparent_line(self.draw_image, (current_x, current_y-2), (current_x, current_y+60), Colors.VIOLET, 1, alpha=0.3)
+                    self.overlays.add_line((current_x-2, current_y), (current_x+60, current_y), Colors.VIOLET, 1, alpha=0.3)
+                    self.overlays.add_line((current_x, current_y-2), (current_x, current_y+60), Colors.VIOLET, 1, alpha=0.3)
         elif selection_mode == BoxManipulationAction.MOVE_RESIZE:
             if self.current_move_box_idx is None:
                 if self.point_1 is not None:
-                    for idx, box in enumerate(program_state.piece_properties.content.get_coordinates()):
-                        if is_point_in_rectangle(self.point_1, box):
-                            self.current_move_box_idx = idx
-                            top_y = max(box[0][1], box[1][1])
-                            bottom_y = min(box[0][1], box[1][1])
-                            left_x = min(box[0][0], box[1][0])
-                            right_x = max(box[0][0], box[1][0])
-
-                            PIXEL_DIFF_FOR_MOVE = 4
-                            if abs(self.point_1[0] - left_x) < PIXEL_DIFF_FOR_MOVE:
-                                self.move_direction = "LEFT"
-                            elif abs(self.point_1[0] - right_x) < PIXEL_DIFF_FOR_MOVE:
-                                self.move_direction = "RIGHT"
-                            elif abs(self.point_1[1] - top_y) < PIXEL_DIFF_FOR_MOVE:
-                                self.move_direction = "BOTTOM"
-                            elif abs(self.point_1[1] - bottom_y) < PIXEL_DIFF_FOR_MOVE:
-                                self.move_direction = "TOP"
-                            else:
-                                self.move_direction = "MOVE"
-                            break
+                    idx = program_state.piece_properties.content.get_index_at_point(self.point_1)
+                    if idx is not None:
+                        box = program_state.piece_properties.content.get_index_coordinates(idx)
+                        self.current_move_box_idx = idx
+                        top_y = max(box[0][1], box[1][1])
+                        bottom_y = min(box[0][1], box[1][1])
+                        left_x = min(box[0][0], box[1][0])
+                        right_x = max(box[0][0], box[1][0])
+
+                        PIXEL_DIFF_FOR_MOVE = 4
+                        if abs(self.point_1[0] - left_x) < PIXEL_DIFF_FOR_MOVE:
+                            self.move_direction = "LEFT"
+                        elif abs(self.point_1[0] - right_x) < PIXEL_DIFF_FOR_MOVE:
+                            self.move_direction = "RIGHT"
+                        elif abs(self.point_1[1] - top_y) < PIXEL_DIFF_FOR_MOVE:
+                            self.move_direction = "BOTTOM"
+                        elif abs(self.point_1[1] - bottom_y) < PIXEL_DIFF_FOR_MOVE:
+                            self.move_direction = "TOP"
+                        else:
+                            self.move_direction = "MOVE"
                     if self.move_direction is None:
                         self.point_1 = None
                         self.point_2 = None
@@ -739,11 +845,11 @@ class OpenCvWindow:
 
                 if self.move_direction is not None and self.move_direction != "MOVE":  # Resize mode
                     draw_increment = get_increments(self.current_mouse_coordinates, self.move_direction)
-                    self.draw_image = cv2.rectangle(self.draw_image, [current_coords[0][0] + draw_increment[0],
-                                                                      current_coords[0][1] + draw_increment[1]],
-                                                    [current_coords[1][0] + draw_increment[2] - 1,
-                                                     current_coords[1][1] + draw_increment[3] - 1],
-                                                    Colors.VIOLET, 1)
+                    self.overlays.add_rectangle([current_coords[0][0] + draw_increment[0],
+                                                 current_coords[0][1] + draw_increment[1]],
+                                                [current_coords[1][0] + draw_increment[2] - 1,
+                                                 current_coords[1][1] + draw_increment[3] - 1],
+                                                Colors.VIOLET, 1)
 
                     if self.point_1 is not None and self.point_2 is not None:
                         increment = get_increments(self.current_mouse_coordinates, self.move_direction)
@@ -758,9 +864,9 @@ class OpenCvWindow:
 
                 elif self.move_direction is not None:  # Move mode
                     draw_increment = (self.current_mouse_coordinates[0] - self.point_1[0], self.current_mouse_coordinates[1] - self.point_1[1])
-                    self.draw_image = cv2.rectangle(self.draw_image, [current_coords[0][0] + draw_increment[0], current_coords[0][1] + draw_increment[1]],
-                            [current_coords[1][0] + draw_increment[0] - 1, current_coords[1][1] + draw_increment[1] - 1],
-                                                    Colors.VIOLET, 1)
+                    self.overlays.add_rectangle([current_coords[0][0] + draw_increment[0], current_coords[0][1] + draw_increment[1]],
+                                                [current_coords[1][0] + draw_increment[0] - 1, current_coords[1][1] + draw_increment[1] - 1],
+                                                Colors.VIOLET, 1)
                     if self.point_1 is not None and self.point_2 is not None:
                         increment = (self.point_2[0] - self.point_1[0], self.point_2[1] - self.point_1[1])
                         self.segmentation_boxes.set_index_coordinates(self.current_move_box_idx, [
@@ -781,21 +887,81 @@ class OpenCvWindow:
             self.point_2 = None
             self.move_direction = None
 
-        if program_state.piece_properties.content:
-            for idx in range(len(program_state.piece_properties.content.get_coordinates())):
-                start, end = program_state.piece_properties.content.get_index_coordinates(idx)
-                if current_annotation_idx is not None and idx == current_annotation_idx:  #currently selected box should be drawn thicker
-                    self.draw_image = cv2.rectangle(self.draw_image, start, [end[0]-1, end[1]-1], Colors.VIOLET, 8)
-                else:
-                    self.draw_image = cv2.rectangle(self.draw_image, start, [end[0]-1, end[1]-1], box_property_to_color(
-                        program_state.piece_properties.content.get_index_type(idx)), self.program_state.gui_state.draw_box_width.get())
-
-
-        cv2.imshow(self.window_name, self.draw_image)
+        self.is_frame_changed = self.render(current_image, program_state.piece_properties.content,
+                                            current_annotation_idx) or keypress != -1
         return self.segmentation_boxes, exit_flag
 
+    def get_base_layer_signature(self, boxes, current_annotation_idx):
+        # everything the base layer depends on, i.e., the viewport, the coordinates and types of the boxes and their appearance
+        return (self.viewport.get_state(), boxes.version if boxes else None, current_annotation_idx,
+                self.program_state.gui_state.draw_box_width.get())
+
+    def draw_boxes(self, image, boxes, current_annotation_idx, visible_rect=None, to_window=lambda point: point,
+                   scale=1.0):
+        if not boxes:
+            return
+        for idx in range(len(boxes)):
+            start, end = boxes.get_index_coordinates(idx)
+            if visible_rect is not None and (max(start[0], end[0]) < visible_rect[0] or min(start[0], end[0]) > visible_rect[2]
+                                             or max(start[1], end[1]) < visible_rect[1] or min(start[1], end[1]) > visible_rect[3]):
+                continue
+            start, end = to_window(start), to_window([end[0]-1, end[1]-1])
+            if current_annotation_idx is not None and idx == current_annotation_idx:  #currently selected box should be drawn thicker
+                cv2.rectangle(image, start, end, Colors.VIOLET, max(int(round(8 * scale)), 1))
+            else:
+                cv2.rectangle(image, start, end, box_property_to_color(boxes.get_index_type(idx)),
+                              max(int(round(self.program_state.gui_state.draw_box_width.get() * scale)), 1))
+
+    def render_base_layer(self, boxes, current_annotation_idx):
+        shape = (self.viewport.height, self.viewport.width) + self.pyramid.page_strip.shape[2:]
+        if self.base_layer is None or self.base_layer.shape != shape:
+            self.base_layer = np.empty(shape, self.pyramid.page_strip.dtype)
+        render_page_strip(self.pyramid, self.viewport, self.base_layer)
+        self.draw_boxes(self.base_layer, boxes, current_annotation_idx, self.viewport.get_visible_rect(),
+                        self.viewport.to_window, self.viewport.zoom)
+
+    def update_viewport(self, page_strip):
+        try:
+            _, _, width, height = cv2.getWindowImageRect(self.window_name)
+        except cv2.error:
+            width, height = -1, -1
+        self.viewport.resize(width, height)
+        if page_strip is not self.base_layer_page_strip:
+            self.pyramid = PagePyramid(page_strip)
+            if self.base_layer_page_strip is None or page_strip.shape != self.base_layer_page_strip.shape:
+                self.viewport.fit(page_strip.width, page_strip.height)
+
+    def render(self, page_strip, boxes, current_annotation_idx):
+        """Redraws the base layer only if its signature changed and composes the overlays on top of it. Only the
+        visible part of the pages is rendered, at window resolution. The window is only updated if the frame changed.
+        Returns True in this case."""
+        is_changed = False
+        self.update_viewport(page_strip)
+        self.current_annotation_idx = current_annotation_idx
+        signature = self.get_base_layer_signature(boxes, current_annotation_idx)
+        if page_strip is not self.base_layer_page_strip or signature != self.base_layer_signature:
+            self.render_base_layer(boxes, current_annotation_idx)
+            self.base_layer_page_strip = page_strip
+            self.base_layer_signature = signature
+            if self.draw_image is None or self.draw_image.shape != self.base_layer.shape:
+                self.draw_image = np.empty_like(self.base_layer)
+            np.copyto(self.draw_image, self.base_layer)
+            self.overlays.invalidate()
+            is_changed = True
+
+        is_changed = self.overlays.compose(self.draw_image, self.base_layer, self.viewport.to_window,
+                                           self.viewport.zoom) or is_changed
+        if is_changed:
+            cv2.imshow(self.window_name, self.draw_image)
+        return is_changed
+
     def get_current_draw_image(self):
-        return self.draw_image
+        """Returns the pages with all boxes at full resolution."""
+        if self.base_layer_page_strip is None:
+            return None
+        image = self.base_layer_page_strip.to_image()
+        self.draw_boxes(image, self.segmentation_boxes, self.current_annotation_idx)
+        return image
 
 
 if __name__ == "__main__":
@@ -806,4 +972,10 @@ if __name__ == "__main__":
         exit(-1)
 
     main_window = MainWindow(weights_path)
+
+    # load and warm up the segmentation model in the background, so that the first segmentation does not have to wait
+    main_window.program_state.gui_state.segmentation_engine.warm_up = True
+    threading.Thread(target=main_window.program_state.gui_state.segmentation_engine.get_model, args=(weights_path,),
+                     daemon=True).start()
+
     main_window.exec()
@@ -0,0 +1,18 @@
+import argparse
+
+from src.hr_segmentation_adapter import export_model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segmentation Model Export Script.")
+
+    parser.add_argument("--weights_path", default="./weights/HRCenterNet.pth.tar",
+                        help="Path to the weight file of the segmentation algorithm. The exported models are saved "
+                             "next to it and are used by the annotation tool instead of the weight file.")
+    parser.add_argument("--onnx", action="store_true",
+                        help="Additionally export an ONNX model, which is used if no TorchScript model exists and "
+                             "onnxruntime is installed.")
+
+    args = parser.parse_args()
+    for exported_path in export_model(args.weights_path, args.onnx):
+        print(f"Exported {exported_path}")
@@ -1,8 +1,8 @@
-import copy
 import dataclasses
 import tkinter as tk
 
 from src.config import FULL_NOTATION_NAME
+from src.frame_scheduler import FrameScheduler
 from src.notation_editor_auxiliary import DisplayState, NotationState, NewSaveLoadFrame, EditMetadataButton, \
     InputNoteFrame, DisplayOptionsFrame, NotationOpenCvWindow
 from src.widgets_auxiliary import on_closing
@@ -35,14 +35,16 @@ class NotationMainWindow:
 
         self.display_state.music_listframe.pack(side=tk.RIGHT, fill=tk.BOTH)
 
-        def start_opencv_timer():
-            def handle_opencv_window():
-                self.notation_state.display_state.image_to_draw = copy.deepcopy(self.notation_state.display_state.image_to_save)
-                self.opencv_window.draw_and_handle_clicks(self.notation_state.display_state.image_to_draw, self.notation_state.display_state.idx_boxes)
-            handle_opencv_window()
-            self.main_window.after(1, start_opencv_timer)
+        def handle_opencv_window():
+            return self.opencv_window.draw_and_handle_clicks(self.notation_state.display_state.image_to_save,
+                                                             self.notation_state.display_state.idx_boxes)
 
-        start_opencv_timer()
+        # the notation window is redrawn on input and state changes, and only rarely when nothing happens
+        opencv_frame_scheduler = FrameScheduler(self.main_window, handle_opencv_window)
+        self.opencv_window.on_input = opencv_frame_scheduler.notify
+        self.main_window.bind_all("<Any-KeyPress>", lambda event: opencv_frame_scheduler.notify(), add="+")
+        self.main_window.bind_all("<Any-ButtonRelease>", lambda event: opencv_frame_scheduler.notify(), add="+")
+        opencv_frame_scheduler.start()
         self.frame.pack(padx=10, pady=10)
         self.main_window.protocol("WM_DELETE_WINDOW", on_closing(self.main_window))
         self.main_window.mainloop()
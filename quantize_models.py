@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import torch
+import torchvision
+
+from src.auxiliary import get_folder_contents
+from src.hr_segmentation_adapter import quantize_model as quantize_segmentation_model, load_model, \
+    load_model_with_backend, get_raw_predictions, get_rectangles, SegmentationBackend
+from src.plugins.lvlvpu_type import ExtendedLvlv
+from src.plugins.suzipu_lvlvpu_gongchepu.models import TemperatureScalingCalibrationModule, CnnModel, \
+    quantize_model, get_quantized_weights_path, remove_small_blobs, crop_excess_whitespace
+from src.plugins.suzipu_lvlvpu_gongchepu import suzipu_intelligent_assistant, lvlvpu_intelligent_assistant
+
+
+SUZIPU_PITCH_WEIGHTS = "./src/plugins/suzipu_lvlvpu_gongchepu/suzi_model_pitch.std"
+SUZIPU_SECONDARY_WEIGHTS = "./src/plugins/suzipu_lvlvpu_gongchepu/suzi_model_secondary.std"
+LVLVPU_WEIGHTS = "./src/plugins/suzipu_lvlvpu_gongchepu/lvlv_model.std"
+
+
+def measure_latency(function, repetitions=5):
+    function()  # warm up
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    return 1000 * (time.perf_counter() - start) / repetitions
+
+
+def box_agreement(reference_boxes, boxes, iou_threshold=0.5):
+    """F1 score of the boxes, taking the boxes of the float model as ground truth."""
+    if len(reference_boxes) == 0 and len(boxes) == 0:
+        return 1.0
+    if len(reference_boxes) == 0 or len(boxes) == 0:
+        return 0.0
+
+    def to_tensor(rectangle_list):
+        return torch.tensor([[x1, y1, x2, y2] for (x1, y1), (x2, y2) in rectangle_list], dtype=torch.float)
+
+    iou = torchvision.ops.box_iou(to_tensor(reference_boxes), to_tensor(boxes))
+    matched = int((iou.max(dim=1).values >= iou_threshold).sum())
+    precision = matched / len(boxes)
+    recall = matched / len(reference_boxes)
+    return 0.0 if precision + recall == 0 else 2 * precision * recall / (precision + recall)
+
+
+def report_segmentation(weights_path, calibration_dir, number_of_calibration_images):
+    image_paths = get_folder_contents(calibration_dir, only_images=True)
+    images = [cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB) for image_path in image_paths]
+    calibration_images = images[:number_of_calibration_images]
+    evaluation_images = images[number_of_calibration_images:] or images  # too few images: evaluate on all of them
+
+    quantized_path = quantize_segmentation_model(weights_path, calibration_images)
+
+    float_model = load_model(weights_path).to("cpu").eval()
+    quantized_model = load_model_with_backend(weights_path, SegmentationBackend.QUANTIZED)
+
+    float_latencies, quantized_latencies, agreements = [], [], []
+    for image in evaluation_images:
+        float_prediction = get_raw_predictions([image], float_model)
+        quantized_prediction = get_raw_predictions([image], quantized_model)
+        agreements.append(box_agreement(get_rectangles(image.shape, float_prediction),
+                                        get_rectangles(image.shape, quantized_prediction)))
+        float_latencies.append(measure_latency(lambda: get_raw_predictions([image], float_model)))
+        quantized_latencies.append(measure_latency(lambda: get_raw_predictions([image], quantized_model)))
+
+    return [
+        f"## Segmentation (HRCenterNet)",
+        f"",
+        f"Quantized model: `{quantized_path}`, calibrated with {len(calibration_images)} pages, evaluated on "
+        f"{len(evaluation_images)} pages.",
+        f"",
+        f"| Model | Latency per page (ms) | Box agreement with float model (F1 at IoU 0.5) |",
+        f"|---|---|---|",
+        f"| float32 | {np.mean(float_latencies):.1f} | 1.000 |",
+        f"| int8 | {np.mean(quantized_latencies):.1f} | {np.mean(agreements):.3f} |",
+        f"",
+    ]
+
+
+def load_classifier_dataset(dataset_dir, notation_type, transformations, preprocess):
+    with open(os.path.join(dataset_dir, "dataset.json"), "r") as file_handle:
+        dataset = json.load(file_handle)
+
+    images, annotations = [], []
+    for entry in dataset:
+        if entry["notation_type"] != notation_type:
+            continue
+        image = cv2.imread(os.path.join(dataset_dir, entry["image_path"]), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        cropped = preprocess(image)
+        if not np.prod(cropped.shape):
+            continue
+        images.append(transformations["evaluation"](cropped))
+        annotations.append(entry["annotation"])
+    return (torch.stack(images) if images else torch.zeros([0, 1, 48, 48])), annotations
+
+
+def report_classifier(name, weights_path, number_of_classes, images, labels, number_of_calibration_images):
+    labels = torch.tensor(labels)
+    calibration_images = images[:number_of_calibration_images]
+    evaluation_images = images[number_of_calibration_images:]
+    evaluation_labels = labels[number_of_calibration_images:]
+    if len(evaluation_images) == 0:  # too few images: evaluate on all of them
+        evaluation_images, evaluation_labels = images, labels
+
+    float_model = TemperatureScalingCalibrationModule(CnnModel(num_classes=number_of_classes))
+    float_model.load_state_dict(torch.load(weights_path))
+    float_model.eval()
+
+    quantized_model = TemperatureScalingCalibrationModule(CnnModel(num_classes=number_of_classes))
+    quantized_model.load_state_dict(torch.load(weights_path))
+    quantized_model.eval()
+    quantize_model(quantized_model.model, calibration_images)
+    torch.save(quantized_model.state_dict(), get_quantized_weights_path(weights_path))
+
+    with torch.no_grad():
+        float_accuracy = float((float_model(evaluation_images).argmax(dim=1) == evaluation_labels).float().mean())
+        quantized_accuracy = float((quantized_model(evaluation_images).argmax(dim=1) == evaluation_labels).float().mean())
+        float_latency = measure_latency(lambda: float_model(evaluation_images))
+        quantized_latency = measure_latency(lambda: quantized_model(evaluation_images))
+
+    return [
+        f"| {name} | float32 | {float_accuracy:.3f} | {float_latency:.1f} |",
+        f"| {name} | int8 | {quantized_accuracy:.3f} | {quantized_latency:.1f} |",
+    ]
+
+
+def report_classifiers(dataset_dir, number_of_calibration_images):
+    lines = [
+        f"## Intelligent Assistant Classifiers",
+        f"",
+        f"Calibrated with the first {number_of_calibration_images} crops of `{dataset_dir}`, evaluated on the rest. "
+        f"Latency is measured for the whole evaluation set at once.",
+        f"",
+        f"| Model | Data type | Accuracy | Latency (ms) |",
+        f"|---|---|---|---|",
+    ]
+
+    suzipu_transformations = suzipu_intelligent_assistant.load_transforms()
+    images, annotations = load_classifier_dataset(dataset_dir, "Suzipu", suzipu_transformations,
+                                                  lambda image: crop_excess_whitespace(remove_small_blobs(image)))
+    if len(images):
+        pitch_to_class = {value: key for key, value in suzipu_transformations["class_to_annotation"]["pitch"].items()}
+        secondary_to_class = {value: key for key, value in suzipu_transformations["class_to_annotation"]["secondary"].items()}
+        lines += report_classifier("Suzipu pitch", SUZIPU_PITCH_WEIGHTS, 11, images,
+                                   [pitch_to_class.get(annotation["pitch"], 0) for annotation in annotations],
+                                   number_of_calibration_images)
+        lines += report_classifier("Suzipu secondary", SUZIPU_SECONDARY_WEIGHTS, 7, images,
+                                   [secondary_to_class.get(annotation.get("secondary"), 0) for annotation in annotations],
+                                   number_of_calibration_images)
+
+    lvlvpu_transformations = lvlvpu_intelligent_assistant.load_transforms()
+    images, annotations = load_classifier_dataset(dataset_dir, "Lvlvpu", lvlvpu_transformations,
+                                                  lvlvpu_intelligent_assistant.crop_excess_whitespace)
+    if len(images):
+        lines += report_classifier("Lülüpu pitch", LVLVPU_WEIGHTS, 17, images,
+                                   [ExtendedLvlv.to_class(annotation["pitch"]) for annotation in annotations],
+                                   number_of_calibration_images)
+
+    return lines + [""]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model Quantization Script.")
+
+    parser.add_argument("--weights_path", default="./weights/HRCenterNet.pth.tar",
+                        help="Path to the weight file of the segmentation algorithm.")
+    parser.add_argument("--calibration_dir", default=None,
+                        help="Path to a folder with page images. The first images are used to calibrate the quantized "
+                             "segmentation model, the remaining ones to compare it with the float model. If omitted, "
+                             "the segmentation model is not quantized.")
+    parser.add_argument("--dataset_dir", default=None,
+                        help="Path to the 'Music' folder of a dataset exported with extract_dataset_from_corpus.py. "
+                             "The first crops are used to calibrate the quantized classifiers of the intelligent "
+                             "assistant, the remaining ones to compare them with the float models. If omitted, the "
+                             "classifiers are not quantized.")
+    parser.add_argument("--number_of_calibration_images", type=int, default=32,
+                        help="Number of images (pages or crops) used for calibration.")
+    parser.add_argument("--report_path", default="./weights/quantization_report.md",
+                        help="Path to which the accuracy-vs-latency report is written (Markdown format).")
+
+    args = parser.parse_args()
+
+    report = [f"# Quantization Report", f""]
+    if args.calibration_dir:
+        report += report_segmentation(args.weights_path, args.calibration_dir, args.number_of_calibration_images)
+    if args.dataset_dir:
+        report += report_classifiers(args.dataset_dir, args.number_of_calibration_images)
+
+    with open(args.report_path, "w") as report_file:
+        report_file.write("\n".join(report))
+    print("\n".join(report))
@@ -0,0 +1,114 @@
+import argparse
+import concurrent.futures
+import json
+import os
+
+import cv2
+import torch
+
+from src.auxiliary import get_folder_contents, pad_images_to_same_size, BoxesWithType, BoxType
+from src.hr_segmentation_adapter import SegmentationEngine
+
+segmentation_engine = SegmentationEngine(cache=None)
+'''Every page is segmented once, so the results are not cached and the pages are not hashed'''
+
+
+def initialize_worker(number_of_threads):
+    torch.set_num_threads(number_of_threads)
+
+
+def segment_piece(image_paths, output_path, weights_path, notation_type, tiled, modern):
+    # each page is read only once, so it is decoded directly instead of filling the page image cache of the worker
+    images = [cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB) for image_path in image_paths]
+    images = pad_images_to_same_size(images)
+    images.reverse()  # the pages are placed from right to left, as in the annotation tool
+
+    boxes = BoxesWithType()
+    boxes.create_from_coordinate_list(segmentation_engine.predict_pages(images, weights_path, tiled=tiled))
+    boxes.sort(modern=modern)
+
+    content = []
+    for idx in range(len(boxes)):
+        (x1, y1), (x2, y2) = boxes.get_index_coordinates(idx)
+        content.append({
+            "box_type": BoxType.UNMARKED,
+            "is_excluded_from_dataset": False,
+            "is_line_break": boxes.is_index_line_break(idx),
+            "text_coordinates": [[x1, y1], [x2, y2]],
+            "text_content": "",
+        })
+
+    json_state = {
+        "version": "2.0",
+        "notation_type": notation_type,
+        "composer": "",
+        "mode_properties": {},
+        "images": [os.path.relpath(image_path, start=os.path.dirname(output_path)) for image_path in image_paths],
+        "content": content,
+    }
+
+    with open(output_path, "w") as json_file:
+        json.dump(json_state, json_file)
+
+    return output_path, len(content)
+
+
+def segment_images(images_dir, output_dir, weights_path, pages_per_piece=1, notation_type="Suzipu", tiled=False,
+                   modern=False, number_of_workers=1, overwrite=False):
+    image_paths = get_folder_contents(images_dir, only_images=True)
+    if not image_paths:
+        print(f"No image files found in directory {images_dir}.")
+        return
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    pieces = []
+    for start in range(0, len(image_paths), pages_per_piece):
+        piece_image_paths = image_paths[start:start + pages_per_piece]
+        output_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(piece_image_paths[0]))[0]}.json")
+        if overwrite or not os.path.exists(output_path):
+            pieces.append((piece_image_paths, output_path))
+
+    # every worker process loads the model once and keeps it for all of its pieces
+    number_of_threads = max(1, (os.cpu_count() or 1) // number_of_workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=number_of_workers, initializer=initialize_worker,
+                                                initargs=(number_of_threads,)) as executor:
+        futures = [executor.submit(segment_piece, piece_image_paths, output_path, weights_path, notation_type, tiled,
+                                   modern) for piece_image_paths, output_path in pieces]
+        for num, future in enumerate(concurrent.futures.as_completed(futures)):
+            try:
+                output_path, number_of_boxes = future.result()
+                print(f"[{num + 1}/{len(futures)}] {output_path}: {number_of_boxes} boxes")
+            except Exception as e:
+                print(f"[{num + 1}/{len(futures)}] Could not segment piece. {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch Segmentation Script.")
+
+    parser.add_argument("--images_dir", required=True, default=None,
+                        help="Path to the folder which contains the page images (PNG, JPEG, TIFF). The images are "
+                             "sorted by file name and grouped into pieces of consecutive pages.")
+    parser.add_argument("--output_dir", required=True, default=None,
+                        help="Path to the output folder to which the corpus files (JSON format) are saved. If it "
+                             "doesn't exist, the script will try to create the folder.")
+    parser.add_argument("--weights_path", default="./weights/HRCenterNet.pth.tar",
+                        help="Path to the weight file of the segmentation algorithm.")
+    parser.add_argument("--pages_per_piece", type=int, default=1,
+                        help="Number of consecutive pages which form one piece.")
+    parser.add_argument("--notation_type", default="Suzipu",
+                        help="Notation type stored in the corpus files.")
+    parser.add_argument("--tiled", action="store_true",
+                        help="Segment the pages at native resolution in overlapping tiles.")
+    parser.add_argument("--modern", action="store_true",
+                        help="Order the boxes in modern reading order (rows from left to right) instead of the "
+                             "traditional one (columns from right to left).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes.")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Segment pieces again even if their corpus file already exists.")
+
+    args = parser.parse_args()
+    segment_images(args.images_dir, args.output_dir, args.weights_path, args.pages_per_piece, args.notation_type,
+                   args.tiled, args.modern, args.workers, args.overwrite)
@@ -1,29 +1,63 @@
-import copy
+import collections
+import concurrent.futures
 import dataclasses
 import importlib
+import itertools
 import os
+import threading
 
 import PIL
 import cv2
 import numpy as np
-import torch
 from PIL import Image, ImageTk
-from torchvision import transforms
 
 
-def draw_transparent_rectangle(image, rect0, rect1, color, thickness, alpha=0.7):
-    overlay = image.copy()
-    overlay = cv2.rectangle(overlay, rect0, rect1,
-                            color, thickness)
-    image = cv2.addWeighted(overlay, alpha, image, 1-alpha, 0)
+_scratch_buffer = np.empty(0, np.uint8)
+
+
+def get_scratch_buffer(shape, dtype=np.uint8):
+    """Returns an uninitialized image of the given shape, whose memory is reused by the following calls."""
+    global _scratch_buffer
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if _scratch_buffer.size < size:
+        _scratch_buffer = np.empty(size, np.uint8)
+    return _scratch_buffer[:size].view(dtype).reshape(shape)
+
+
+def get_bounding_rect(points, thickness, image_shape):
+    """Returns the rectangle (x1, y1, x2, y2) which contains a primitive through the points drawn with the given
+    thickness, clipped to the image, or None if it is outside the image."""
+    height, width = image_shape[:2]
+    margin = thickness // 2 + 1
+    x1 = max(min(point[0] for point in points) - margin, 0)
+    y1 = max(min(point[1] for point in points) - margin, 0)
+    x2 = min(max(point[0] for point in points) + margin + 1, width)
+    y2 = min(max(point[1] for point in points) + margin + 1, height)
+    return (x1, y1, x2, y2) if x2 > x1 and y2 > y1 else None
+
+
+def _draw_transparent(image, points, thickness, alpha, draw):
+    # blends only the bounding rectangle of the primitive, in place
+    rect = get_bounding_rect(points, thickness, image.shape)
+    if rect is None:
+        return image
+    x1, y1, x2, y2 = rect
+    roi = image[y1:y2, x1:x2]
+    overlay = get_scratch_buffer(roi.shape, roi.dtype)
+    np.copyto(overlay, roi)
+    draw(overlay, [(point[0] - x1, point[1] - y1) for point in points])
+    cv2.addWeighted(overlay, alpha, roi, 1-alpha, 0, dst=roi)
     return image
 
 
+def draw_transparent_rectangle(image, rect0, rect1, color, thickness, alpha=0.7):
+    return _draw_transparent(image, [rect0, rect1], thickness, alpha,
+                             lambda overlay, points: cv2.rectangle(overlay, points[0], points[1], color, thickness))
+
+
 def draw_transparent_line(image, p1, p2, color, thickness, alpha=0.7):
-    overlay = image.copy()
-    overlay = cv2.line(overlay, p1, p2, color, thickness)
-    image = cv2.addWeighted(overlay, alpha, image, 1-alpha, 0)
-    return image
+    return _draw_transparent(image, [p1, p2], thickness, alpha,
+                             lambda overlay, points: cv2.line(overlay, points[0], points[1], color, thickness))
 
 
 def get_folder_contents(path, only_images=False):
@@ -37,6 +71,177 @@ def get_folder_contents(path, only_images=False):
         print(f"Could not read files from directory {path}. {e}")
 
 
+def pad_images_to_same_size(images):
+    max_width, max_height = 0, 0
+    for image in images:
+        max_height = max(image.shape[0], max_height)
+        max_width = max(image.shape[1], max_width)
+
+    padded_images = []
+    for image in images:
+        padded_images.append(cv2.copyMakeBorder(
+            src=image,
+            top=0,
+            bottom=max_height - image.shape[0],
+            left=0,
+            right=max_width - image.shape[1],
+            borderType=cv2.BORDER_CONSTANT,
+            value=[255, 255, 255]
+        ))
+    return padded_images
+
+
+class PageImageCache:
+    """Thread-safe LRU cache of decoded page images (RGB). The key is the path together with the modification time
+    and size of the file, so changed files are decoded again. The least recently used pages are evicted when max_size
+    bytes are exceeded. The cached images are shared and must not be modified in place."""
+    def __init__(self, max_size=512 * 1024 * 1024):
+        self.max_size = max_size
+        self.images = collections.OrderedDict()
+        '''OrderedDict[(absolute path, modification time, file size)] -> decoded image, least recently used first'''
+        self.size = 0
+        self.loading = {}
+        '''dict[key] -> Future of a page which is currently decoded by some thread'''
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(image_path):
+        stat = os.stat(image_path)
+        return os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size
+
+    def get(self, image_path):
+        key = self.get_key(image_path)
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                return image
+            loading = self.loading.get(key)
+            is_loading_thread = loading is None
+            if is_loading_thread:
+                loading = self.loading[key] = concurrent.futures.Future()
+
+        if not is_loading_thread:  # another thread is already decoding this page
+            return loading.result()
+
+        try:
+            image = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)  # decoded outside the lock
+            self.put(key, image)
+            loading.set_result(image)
+            return image
+        except Exception as e:
+            loading.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.loading[key]
+
+    def put(self, key, image):
+        with self.lock:
+            for stale_key in [k for k in self.images if k[0] == key[0] and k != key]:  # outdated versions of the file
+                self.size -= self.images.pop(stale_key).nbytes
+            if key in self.images or image.nbytes > self.max_size:
+                return
+            self.images[key] = image
+            self.size += image.nbytes
+            while self.size > self.max_size:
+                _, evicted_image = self.images.popitem(last=False)
+                self.size -= evicted_image.nbytes
+
+    def __contains__(self, image_path):
+        try:
+            key = self.get_key(image_path)
+        except OSError:
+            return False
+        with self.lock:
+            return key in self.images
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.size = 0
+
+
+page_image_cache = PageImageCache()
+
+
+class PageStrip:
+    """The pages of a piece placed next to each other from left to right, without building the concatenated image.
+    All coordinates are global, i.e., they refer to the concatenated image in which every page is padded with white
+    to the size of the largest page (as in pad_images_to_same_size). The pages are shared (e.g., with the page image
+    cache) and are never modified, so the returned crops must not be modified in place either."""
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.page_width = max(page.shape[1] for page in self.pages)
+        self.height = max(page.shape[0] for page in self.pages)
+        self.width = self.page_width * len(self.pages)
+        self.shape = (self.height, self.width) + self.pages[0].shape[2:]
+        self.dtype = self.pages[0].dtype
+
+    def __len__(self):
+        return len(self.pages)
+
+    def get_page_index(self, x):
+        return min(max(x // self.page_width, 0), len(self.pages) - 1)
+
+    def get_x_offset(self, page_idx):
+        return page_idx * self.page_width
+
+    def clip(self, x1, y1, x2, y2):
+        return max(x1, 0), max(y1, 0), min(x2, self.width), min(y2, self.height)
+
+    def crop(self, x1, y1, x2, y2):
+        """Returns the region [x1, x2) x [y1, y2), clipped to the strip. If the region lies within a single page, this
+        is a view of the page, otherwise a new image."""
+        x1, y1, x2, y2 = self.clip(x1, y1, x2, y2)
+        if x2 <= x1 or y2 <= y1:
+            return np.zeros((max(y2 - y1, 0), max(x2 - x1, 0)) + self.shape[2:], self.dtype)
+
+        page_idx = self.get_page_index(x1)
+        page = self.pages[page_idx]
+        x_offset = self.get_x_offset(page_idx)
+        if x2 <= x_offset + page.shape[1] and y2 <= page.shape[0]:
+            return page[y1:y2, x1 - x_offset:x2 - x_offset]
+
+        image = np.empty((y2 - y1, x2 - x1) + self.shape[2:], self.dtype)
+        self.copy_to(image, x1, y1, x2, y2)
+        return image
+
+    def copy_to(self, target, x1=0, y1=0, x2=None, y2=None):
+        """Writes the region [x1, x2) x [y1, y2) into target, whose top left corner corresponds to (x1, y1)."""
+        x1, y1, x2, y2 = self.clip(x1, y1, self.width if x2 is None else x2, self.height if y2 is None else y2)
+        if x2 <= x1 or y2 <= y1:
+            return
+        for page_idx in range(self.get_page_index(x1), self.get_page_index(x2 - 1) + 1):
+            page = self.pages[page_idx]
+            x_offset = self.get_x_offset(page_idx)
+            slot_x1, slot_x2 = max(x1, x_offset), min(x2, x_offset + self.page_width)
+            page_x2 = min(slot_x2, x_offset + page.shape[1])
+            page_y2 = min(y2, page.shape[0])
+            if page_x2 > slot_x1 and page_y2 > y1:
+                target[:page_y2 - y1, slot_x1 - x1:page_x2 - x1] = \
+                    page[y1:page_y2, slot_x1 - x_offset:page_x2 - x_offset]
+            # white padding right of and below pages which are smaller than the largest page
+            if page_x2 < slot_x2:
+                target[:, max(page_x2, slot_x1) - x1:slot_x2 - x1] = 255
+            if page_y2 < y2:
+                target[max(page_y2 - y1, 0):, slot_x1 - x1:slot_x2 - x1] = 255
+
+    def __getitem__(self, key):
+        """Supports the slicing of boxes, i.e., strip[y1:y2, x1:x2] and strip[y1:y2, x1:x2, channel]."""
+        rows, columns = key[:2]
+        image = self.crop(columns.start or 0, rows.start or 0,
+                          self.width if columns.stop is None else columns.stop,
+                          self.height if rows.stop is None else rows.stop)
+        return image[(slice(None), slice(None)) + tuple(key[2:])]
+
+    def to_image(self):
+        """Builds the concatenated image. Only needed where a single image is inevitable."""
+        image = np.empty(self.shape, self.dtype)
+        self.copy_to(image)
+        return image
+
+
 def pil_to_cv(pil_image):
     open_cv_image = np.array(pil_image)
     return open_cv_image[:, :, ::-1].copy()
@@ -189,57 +394,70 @@ def get_class_variables(classname):
             not callable(getattr(classname, key)) and not key.startswith("__")]
 
 
-def get_image_from_box_fixed_size(current_image, box):
-    def shrink(target_size=70):
-        def inner(input_image):
-            t_size = target_size
-
-            original_width = input_image.shape[-1]
-            original_height = input_image.shape[-2]
-            aspect_ratio = original_width / original_height
+def get_nearest_exact_indices(input_size, output_size):
+    scale = np.float32(input_size / output_size)
+    indices = np.floor((np.arange(output_size, dtype=np.float32) + np.float32(0.5)) * scale).astype(np.intp)
+    return np.minimum(indices, input_size - 1)
 
-            if aspect_ratio > 1:
-                w = int(t_size)
-                h = int(t_size / aspect_ratio)
-            else:
-                w = int(t_size * aspect_ratio)
-                h = int(t_size)
-
-            output_image = transforms.Resize(size=(h, w), interpolation=transforms.InterpolationMode.NEAREST_EXACT)(
-                input_image)
-            return output_image
-
-        return inner
-
-    def paste_to_square(target_size=80):
-        def inner(input_image):
-            pad_width = target_size - input_image.shape[-1]
-            pad_height = target_size - input_image.shape[-2]
-
-            left_pad = pad_width // 2
-            top_pad = pad_height // 2
-
-            right_pad = pad_width - left_pad
-            bottom_pad = pad_height - top_pad
-
-            output_image = transforms.Pad(padding=(left_pad, top_pad, right_pad, bottom_pad), fill=255)(input_image)
-            return output_image
-        return inner
 
+def get_thumbnail_from_box(current_image, box, target_size=70, square_size=80):
+    """Returns the content of the box, resized (nearest neighbour) such that its longer side has target_size pixels and
+    pasted to the center of a white square of square_size pixels."""
     (x1, y1), (x2, y2) = box
     x1, x2 = min(x1, x2), max(x1, x2)
     y1, y2 = min(y1, y2), max(y1, y2)
 
     cropped_img = current_image[y1:y2, x1:x2]
-    blue, green, red = cv2.split(cropped_img)
-    blue, green, red = torch.Tensor(blue).unsqueeze(0), torch.Tensor(green).unsqueeze(0), torch.Tensor(red).unsqueeze(0)
-    cropped_img = torch.cat((red, green, blue), dim=0)
-    cropped_img = shrink()(torch.Tensor(cropped_img))
-    cropped_img = paste_to_square()(cropped_img)
-    cropped_img = cropped_img.permute([1, 2, 0])
-    cropped_img = cropped_img.numpy().astype(np.uint8)
-    cropped_img = Image.fromarray(cropped_img)
-    return ImageTk.PhotoImage(image=cropped_img)
+    if cropped_img.shape[0] == 0 or cropped_img.shape[1] == 0:  # degenerate box or outside of the image
+        return np.full((square_size, square_size, 3), 255, dtype=np.uint8)
+    aspect_ratio = cropped_img.shape[1] / cropped_img.shape[0]
+    if aspect_ratio > 1:
+        w, h = target_size, int(target_size / aspect_ratio)
+    else:
+        w, h = int(target_size * aspect_ratio), target_size
+    # nearest neighbour sampling at the pixel centers, i.e., the rows/columns floor((i + 0.5) * scale)
+    rows = get_nearest_exact_indices(cropped_img.shape[0], max(h, 1))
+    columns = get_nearest_exact_indices(cropped_img.shape[1], max(w, 1))
+    cropped_img = cv2.cvtColor(cropped_img[rows[:, None], columns], cv2.COLOR_BGR2RGB)
+
+    pad_width, pad_height = square_size - cropped_img.shape[1], square_size - cropped_img.shape[0]
+    left_pad, top_pad = pad_width // 2, pad_height // 2
+    return cv2.copyMakeBorder(cropped_img, top_pad, pad_height - top_pad, left_pad, pad_width - left_pad,
+                              cv2.BORDER_CONSTANT, value=[255, 255, 255])
+
+
+def get_image_from_box_fixed_size(current_image, box):
+    return ImageTk.PhotoImage(image=Image.fromarray(get_thumbnail_from_box(current_image, box)))
+
+
+class BoxThumbnailCache:
+    """Tkinter thumbnails of the boxes, created only when a box is displayed. The key is the page image together with
+    the box coordinates, so moved or resized boxes get a new thumbnail. Only the thumbnails of the current page image
+    are kept, at most max_entries of them (least recently used are evicted first)."""
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.thumbnails = collections.OrderedDict()
+        '''OrderedDict[(id(page image), box coordinates)] -> tkinter image, least recently used first'''
+        self.page_image = None
+        '''The page image of the cached thumbnails, kept alive so that its id is not reused'''
+
+    def get(self, page_image, box):
+        if page_image is not self.page_image:
+            self.clear()
+            self.page_image = page_image
+        key = (id(page_image), tuple(map(tuple, box)))
+        thumbnail = self.thumbnails.get(key)
+        if thumbnail is None:
+            thumbnail = self.thumbnails[key] = get_image_from_box_fixed_size(page_image, box)
+            if len(self.thumbnails) > self.max_entries:
+                self.thumbnails.popitem(last=False)
+        else:
+            self.thumbnails.move_to_end(key)
+        return thumbnail
+
+    def clear(self):
+        self.thumbnails.clear()
+        self.page_image = None
 
 
 def cv_to_tkinter_image(cv_image):
@@ -313,10 +531,105 @@ class SetInt(JsonSerializable):
         return self.value
 
 
+class BoxSpatialIndex:
+    """Uniform grid over the boxes of a BoxesWithType for hit-testing, which is kept up to date by the methods of
+    BoxesWithType. The boxes are identified by their dict, so reordering the boxes only invalidates their indices."""
+    def __init__(self, boxes_list, cell_size=128):
+        self.boxes_list = boxes_list
+        self.cell_size = cell_size
+        self.cells = collections.defaultdict(set)
+        '''dict[(column, row)] -> set of the ids of the boxes overlapping the cell'''
+        self.box_cells = {}
+        '''dict[id of box] -> (box, list of the cells the box is in)'''
+        self.positions = None
+        '''dict[id of box] -> index of the box in boxes_list, rebuilt lazily after deletions and reorderings'''
+        for box in self.boxes_list:
+            self.insert(box)
+
+    def get_cells(self, coordinates):
+        if not coordinates:
+            return []
+        (x1, y1), (x2, y2) = coordinates
+        x1, x2 = int(min(x1, x2)) // self.cell_size, int(max(x1, x2)) // self.cell_size
+        y1, y2 = int(min(y1, y2)) // self.cell_size, int(max(y1, y2)) // self.cell_size
+        return [(column, row) for column in range(x1, x2 + 1) for row in range(y1, y2 + 1)]
+
+    def insert(self, box):
+        cells = self.get_cells(box["coordinates"])
+        for cell in cells:
+            self.cells[cell].add(id(box))
+        self.box_cells[id(box)] = (box, cells)
+        self.positions = None
+
+    def remove(self, box):
+        _, cells = self.box_cells.pop(id(box), (None, []))
+        for cell in cells:
+            self.cells[cell].discard(id(box))
+            if not self.cells[cell]:
+                del self.cells[cell]
+        self.positions = None
+
+    def update(self, box):
+        self.remove(box)
+        self.insert(box)
+
+    def reorder(self, boxes_list):
+        self.boxes_list = boxes_list
+        self.positions = None
+
+    def get_indices_at_point(self, point):
+        if self.positions is None:
+            self.positions = {id(box): idx for idx, box in enumerate(self.boxes_list)}
+        cell = (int(point[0]) // self.cell_size, int(point[1]) // self.cell_size)
+        return sorted(self.positions[box_id] for box_id in self.cells.get(cell, ())
+                      if is_point_in_rectangle(point, self.box_cells[box_id][0]["coordinates"]))
+
+
+_boxes_versions = itertools.count()
+
+
 @dataclasses.dataclass
 class BoxesWithType(JsonSerializable):
     boxes_list: list[dict] = dataclasses.field(default_factory=lambda: [])
 
+    @property
+    def version(self):
+        """Changes whenever the coordinates, types, number or order of the boxes change. The versions are unique
+        across all instances, so comparing them also detects that the boxes have been replaced."""
+        if "_version" not in self.__dict__:  # not a dataclass field, see get_spatial_index
+            self._version = next(_boxes_versions)
+        return self._version
+
+    def _bump_version(self):
+        self._version = next(_boxes_versions)
+
+    def get_spatial_index(self) -> BoxSpatialIndex:
+        # not a dataclass field, so that it is neither dumped nor compared; built on the first hit test
+        spatial_index = self.__dict__.get("_spatial_index")
+        if spatial_index is None or spatial_index.boxes_list is not self.boxes_list \
+                or len(spatial_index.box_cells) != len(self.boxes_list):  # boxes_list has been replaced
+            spatial_index = self._spatial_index = BoxSpatialIndex(self.boxes_list)
+        return spatial_index
+
+    def _update_spatial_index(self, method, *args):
+        spatial_index = self.__dict__.get("_spatial_index")
+        if spatial_index is not None and spatial_index.boxes_list is self.boxes_list:
+            getattr(spatial_index, method)(*args)
+
+    def __getstate__(self):  # copies build their own spatial index, since it identifies the boxes by their ids
+        state = dict(self.__dict__)
+        state.pop("_spatial_index", None)
+        return state
+
+    def get_indices_at_point(self, point):
+        """Returns the indices of all boxes containing the point in ascending order."""
+        return self.get_spatial_index().get_indices_at_point(point)
+
+    def get_index_at_point(self, point):
+        """Returns the smallest index of the boxes containing the point, or None."""
+        indices = self.get_indices_at_point(point)
+        return indices[0] if indices else None
+
     @classmethod
     def create_new_box(cls, coordinates: tuple = tuple(), type: str =BoxType.UNMARKED, annotation=None, is_excluded_from_dataset: bool = False, is_line_break: bool = False):
         if not annotation:  # default annotation
@@ -334,12 +647,17 @@ class BoxesWithType(JsonSerializable):
     def create_from_coordinate_list(self, coordinate_list):
         for coordinate in coordinate_list:
             self.boxes_list.append(self.create_new_box(coordinate))
+            self._update_spatial_index("insert", self.boxes_list[-1])
+        self._bump_version()
 
     def reset(self):
         self.boxes_list = []
+        self._bump_version()
 
     def add_rectangle(self, point_1, point_2, type=BoxType.UNMARKED):
         self.boxes_list.append(self.create_new_box((point_1, point_2), type))
+        self._update_spatial_index("insert", self.boxes_list[-1])
+        self._bump_version()
 
     def get_coordinates(self):
         coordinate_list = []
@@ -371,9 +689,12 @@ class BoxesWithType(JsonSerializable):
 
     def set_index_coordinates(self, idx, coordinates):
         self.boxes_list[idx]["coordinates"] = coordinates
+        self._update_spatial_index("update", self.boxes_list[idx])
+        self._bump_version()
 
     def set_index_type(self, idx, type):
         self.boxes_list[idx]["box_type"] = type
+        self._bump_version()
 
     def set_index_annotation(self, idx, annotation):
         try:
@@ -388,23 +709,30 @@ class BoxesWithType(JsonSerializable):
         self.boxes_list[idx]["is_line_break"] = boolean
 
     def delete_index(self, idx):
+        self._update_spatial_index("remove", self.boxes_list[idx])
         del self.boxes_list[idx]
+        self._bump_version()
 
     def delete_multiple_indices(self, idxs):
         for idx in sorted(idxs, reverse=True):
-            del self.boxes_list[idx]
+            self.delete_index(idx)
 
     def reorder(self, new_order):
         if len(new_order) == len(self):
-            self.boxes_list = [self.boxes_list[idx] for idx in new_order]
+            boxes_list = [self.boxes_list[idx] for idx in new_order]
+            self._update_spatial_index("reorder", boxes_list)
+            self.boxes_list = boxes_list
+            self._bump_version()
         else:
             raise ValueError(f"len of new_order ('{len(new_order)}') must be the same as len of boxes_list ('{len(self)}')")
 
     def partial_reorder(self, new_order):
-        boxes_copy = copy.deepcopy(self.boxes_list)
+        boxes_copy = list(self.boxes_list)  # the boxes are only permuted, so they do not have to be copied
         old_order = sorted(new_order)
         for idx in range(len(new_order)):
             self.boxes_list[old_order[idx]] = boxes_copy[new_order[idx]]
+        self._update_spatial_index("reorder", self.boxes_list)
+        self._bump_version()
 
     def sort(self, modern=False):
         if len(self):
@@ -451,23 +779,26 @@ class BoxesWithType(JsonSerializable):
             for idx in line_break_idxs[:-1]:
                 self.set_index_line_break(idx, True)
 
-            self.boxes_list = [self.boxes_list[idx] for idx in sorted_idxs]
+            boxes_list = [self.boxes_list[idx] for idx in sorted_idxs]
+            self._update_spatial_index("reorder", boxes_list)
+            self.boxes_list = boxes_list
+            self._bump_version()
 
     @classmethod
     def fit_min_bounding_rect_single(cls, image, box):
-        copy_image = 255 * np.ones_like(image)
-        copy_image[box[0][1]:box[1][1], box[0][0]:box[1][0]] = image[box[0][1]:box[1][1], box[0][0]:box[1][0]]
-        gray = 255 * (copy_image < 128).astype(np.uint8)  # reverse the colors
-        coords = cv2.findNonZero(gray[:, :, 0])  # Find all non-zero points (text)
+        x1, y1 = max(box[0][0], 0), max(box[0][1], 0)
+        cropped_image = image[y1:box[1][1], x1:box[1][0], 0]  # only the box is needed, works for PageStrip as well
+        gray = 255 * (cropped_image < 128).astype(np.uint8)  # reverse the colors
+        coords = cv2.findNonZero(gray)  # Find all non-zero points (text)
         x, y, w, h = cv2.boundingRect(coords)  # Find minimum spanning bounding box
 
         if w > 0 and h > 0:
-            return [[x, y], [x + w, y + h]]
+            return [[x1 + x, y1 + y], [x1 + x + w, y1 + y + h]]
         return box
 
     def fit_min_bounding_rects(self, image):
         for idx in range(len(self.boxes_list)):
-            self.boxes_list[idx]["coordinates"] = self.fit_min_bounding_rect_single(image, self.boxes_list[idx]["coordinates"])
+            self.set_index_coordinates(idx, self.fit_min_bounding_rect_single(image, self.boxes_list[idx]["coordinates"]))
 
     def __bool__(self):
         return self.boxes_list is not None
@@ -1,3 +1,5 @@
+import os
+
 FULL_ANNOTATION_NAME = "Chinese Musical Notation Annotation Tool"
 FULL_NOTATION_NAME = "Chinese Musical Notation Editor"
 
@@ -18,3 +20,7 @@ NOTATION_BUTTON_IMAGE = "./res/notation_button.png"
 JIANPU_BUTTON_IMAGE = "./res/jianpu_button.png"
 FIVELINE_BUTTON_IMAGE = "./res/fiveline_button.png"
 
+USE_QUANTIZED_MODELS = False  # use the int8 models created by quantize_models.py instead of the float models, if present
+
+USE_SEGMENTATION_CACHE = True  # keep segmentation results on disk, so that pages which were already segmented are not segmented again
+SEGMENTATION_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "segmentation")
@@ -1,7 +1,5 @@
 import dataclasses
 
-import music21
-
 
 class FingeringProperties:
     def __init__(self, name, chinese_name, transposition_index, image_data):
@@ -32,6 +30,8 @@ class Fingering:
 
 
 def fingering_to_lowest_note(fingering: FingeringProperties):
+    import music21
+
     transposition = fingering.transposition_index
     base_note = music21.note.Note("C4")
     base_note = base_note.transpose(transposition)
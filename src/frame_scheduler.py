@@ -0,0 +1,58 @@
+import time
+
+
+class FrameScheduler:
+    """Calls draw_frame on the Tk event loop at an adaptive rate instead of a fixed interval. As long as there is
+    activity, i.e., input events reported with notify() or frames which changed the displayed image, the frames are
+    drawn at most max_fps times per second (which also caps the frame rate while dragging). Without activity, the
+    interval is doubled up to idle_interval ms, which is still short enough to notice OpenCV key presses quickly.
+
+    draw_frame must return True if it has changed something."""
+    def __init__(self, tk_widget, draw_frame, max_fps=60, idle_interval=100):
+        self.tk_widget = tk_widget
+        self.draw_frame = draw_frame
+        self.min_interval = max(int(1000 / max_fps), 1)
+        self.idle_interval = idle_interval
+        self.interval = self.min_interval
+        self.is_active = False
+        '''True if notify() has been called since the last frame'''
+        self.is_drawing = False
+        self.pending_frame = None
+        '''The id of the scheduled Tk callback, if any'''
+        self.last_frame_time = 0
+
+    def start(self):
+        self._schedule(0)
+
+    def notify(self):
+        """Reports activity, e.g., an input event or a state change, so that the next frame is drawn soon."""
+        self.is_active = True
+        self.interval = self.min_interval
+        if self.is_drawing or self.pending_frame is None:  # the next frame is scheduled after the current one
+            return
+        # replace the pending idle frame by one which respects the frame rate cap
+        self.tk_widget.after_cancel(self.pending_frame)
+        elapsed = 1000 * (time.perf_counter() - self.last_frame_time)
+        self._schedule(max(int(self.min_interval - elapsed), 0))
+
+    def _schedule(self, delay):
+        self.pending_frame = self.tk_widget.after(delay, self._on_frame)
+
+    def _on_frame(self):
+        self.pending_frame = None
+        self.last_frame_time = time.perf_counter()
+        self.is_active = False
+
+        self.is_drawing = True
+        try:
+            is_changed = self.draw_frame()
+        finally:
+            self.is_drawing = False
+
+        if is_changed or self.is_active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(2 * self.interval, self.idle_interval)
+
+        elapsed = 1000 * (time.perf_counter() - self.last_frame_time)
+        self._schedule(max(int(self.interval - elapsed), 1))
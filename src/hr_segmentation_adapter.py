@@ -1,16 +1,25 @@
+import hashlib
+import json
+
 import cv2
 import torch
 import argparse
 import torch
-from torch.autograd import Variable
 import torchvision
 from torchvision.ops import nms
 import os
-from PIL import Image
 import numpy as np
 from skimage.draw import rectangle_perimeter
 
 import sys
+import threading
+
+from src.config import USE_QUANTIZED_MODELS, USE_SEGMENTATION_CACHE, SEGMENTATION_CACHE_DIR
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
 
 sys.path.append("./src/HRCenterNet")
 from models.HRCenterNet import HRCenterNet as segmentation_net
@@ -25,6 +34,8 @@ device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 input_size = 512
 output_size = 128
+preprocessing_version = "cv2_inter_area"
+'''Part of the cache key, must be changed whenever the preprocessing changes the network input'''
 
 
 def load_model(weights_path):
@@ -41,75 +52,607 @@ def load_model(weights_path):
         print(f"Could not create model. {e}")
 
 
-def get_rectangles(img_shape, prediction, nms_score=0.3, iou_threshold=0.1):
-    bbox = list()
-    score_list = list()
+def get_exported_model_path(weights_path, extension):
+    """Path of an exported model next to the weights file, e.g. './weights/HRCenterNet.torchscript.pt' for
+    './weights/HRCenterNet.pth.tar'."""
+    base_path = weights_path
+    for suffix in [".tar", ".pth"]:
+        if base_path.endswith(suffix):
+            base_path = base_path[:-len(suffix)]
+    return f"{base_path}{extension}"
 
-    heatmap = prediction.data.cpu().numpy()[0, 0, ...]
-    offset_y = prediction.data.cpu().numpy()[0, 1, ...]
-    offset_x = prediction.data.cpu().numpy()[0, 2, ...]
-    width_map = prediction.data.cpu().numpy()[0, 3, ...]
-    height_map = prediction.data.cpu().numpy()[0, 4, ...]
 
-    for j in np.where(heatmap.reshape(-1, 1) >= nms_score)[0]:
-        row = j // output_size
-        col = j - row * output_size
+class SegmentationBackend:
+    AUTO = "auto"
+    QUANTIZED = "int8"
+    TORCHSCRIPT = "torchscript"
+    ONNX = "onnx"
+    EAGER = "eager"
 
-        bias_x = offset_x[row, col] * (img_shape[0] / output_size)
-        bias_y = offset_y[row, col] * (img_shape[1] / output_size)
 
-        width = width_map[row, col] * output_size * (img_shape[0] / output_size)
-        height = height_map[row, col] * output_size * (img_shape[1] / output_size)
+exported_model_extensions = {
+    SegmentationBackend.QUANTIZED: ".int8.torchscript.pt",
+    SegmentationBackend.TORCHSCRIPT: ".torchscript.pt",
+    SegmentationBackend.ONNX: ".onnx",
+}
 
-        score_list.append(heatmap[row, col])
 
-        row = row * (img_shape[0] / output_size) + bias_y
-        col = col * (img_shape[1] / output_size) + bias_x
+def is_exported_model_usable(weights_path, exported_path):
+    # an export older than the weights file belongs to outdated weights
+    return os.path.isfile(exported_path) and os.path.getmtime(exported_path) >= os.path.getmtime(weights_path)
 
-        top = row - width // 2
-        left = col - height // 2
-        bottom = row + width // 2
-        right = col + height // 2
 
-        bbox.append([top, left, bottom, right])
+def select_backend(weights_path, backend=SegmentationBackend.AUTO):
+    """Returns the backend to use for the weights file. In auto mode, an exported TorchScript model is preferred over
+    an exported ONNX model (if onnxruntime is installed) and the eager model is the fallback. The int8 model is only
+    chosen if USE_QUANTIZED_MODELS is set."""
+    if backend != SegmentationBackend.AUTO:
+        return backend
 
-    _nms_index = torchvision.ops.nms(torch.FloatTensor(bbox), scores=torch.flatten(torch.FloatTensor(score_list)),
-                                     iou_threshold=iou_threshold)
+    if USE_QUANTIZED_MODELS and device.type == "cpu" and is_exported_model_usable(weights_path, get_exported_model_path(weights_path, exported_model_extensions[SegmentationBackend.QUANTIZED])):
+        return SegmentationBackend.QUANTIZED
+    if is_exported_model_usable(weights_path, get_exported_model_path(weights_path, exported_model_extensions[SegmentationBackend.TORCHSCRIPT])):
+        return SegmentationBackend.TORCHSCRIPT
+    if onnxruntime is not None and is_exported_model_usable(weights_path, get_exported_model_path(weights_path, exported_model_extensions[SegmentationBackend.ONNX])):
+        return SegmentationBackend.ONNX
+    return SegmentationBackend.EAGER
 
-    output_values = []
-    for k in range(len(_nms_index)):
-        top, left, bottom, right = bbox[_nms_index[k]]
 
-        start = (int(left), int(top))
-        end = (int(right), int(bottom))
+class OnnxRuntimeModel:
+    def __init__(self, onnx_path):
+        self.session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
 
-        output_values.append((start, end))
-    return output_values
+    def __call__(self, inp):
+        prediction = self.session.run(None, {self.input_name: inp.cpu().numpy()})[0]
+        return torch.from_numpy(prediction)
 
+    def eval(self):
+        return self
 
-def get_raw_prediction(input_img, model):
-    test_tx = torchvision.transforms.Compose([
-        torchvision.transforms.ToTensor(),
-        torchvision.transforms.Resize((input_size, input_size), antialias=True),
-        #torchvision.transforms.ToTensor(),
-    ])
 
+def load_model_with_backend(weights_path, backend):
+    try:
+        if backend == SegmentationBackend.QUANTIZED:
+            return torch.jit.load(get_exported_model_path(weights_path, exported_model_extensions[backend]),
+                                  map_location="cpu")
+        if backend == SegmentationBackend.TORCHSCRIPT:
+            # the graph optimizations depend on the machine, so they are applied after loading instead of on export
+            model = torch.jit.load(get_exported_model_path(weights_path, exported_model_extensions[backend]),
+                                   map_location=device)
+            return torch.jit.optimize_for_inference(model)
+        if backend == SegmentationBackend.ONNX:
+            return OnnxRuntimeModel(get_exported_model_path(weights_path, exported_model_extensions[backend]))
+    except Exception as e:
+        print(f"Could not load the exported {backend} model, using the eager model instead. {e}")
+    return load_model(weights_path=weights_path)
+
+
+def quantize_model(weights_path, calibration_images):
+    """Post-training static int8 quantization of the conv layers. The activation ranges are calibrated with a few page
+    images, the quantized model is saved as TorchScript next to the weights file and its path is returned."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    model = load_model(weights_path=weights_path)
+    model = model.to("cpu").eval()
+    example_input = torch.zeros((1, 3, input_size, input_size), dtype=torch.float)
+
+    prepared_model = prepare_fx(model, get_default_qconfig_mapping("x86"), example_inputs=(example_input,))
+    with torch.no_grad():
+        for calibration_image in calibration_images:
+            prepared_model(image_to_tensor(calibration_image).unsqueeze(0))
+        quantized_model = convert_fx(prepared_model)
+        quantized_model = torch.jit.freeze(torch.jit.trace(quantized_model, example_input))
+
+    quantized_path = get_exported_model_path(weights_path, exported_model_extensions[SegmentationBackend.QUANTIZED])
+    quantized_model.save(quantized_path)
+    return quantized_path
+
+
+def export_model(weights_path, export_onnx=False):
+    """Exports a frozen TorchScript model (and optionally an ONNX model) next to the weights file."""
+    model = load_model(weights_path=weights_path)
+    model = model.to("cpu").eval()
+    example_input = torch.zeros((1, 3, input_size, input_size), dtype=torch.float)
+
+    exported_paths = []
+    with torch.no_grad():
+        traced_model = torch.jit.trace(model, example_input)
+        frozen_model = torch.jit.freeze(traced_model)
+        torchscript_path = get_exported_model_path(weights_path, exported_model_extensions[SegmentationBackend.TORCHSCRIPT])
+        frozen_model.save(torchscript_path)
+        exported_paths.append(torchscript_path)
+
+        if export_onnx:
+            onnx_path = get_exported_model_path(weights_path, exported_model_extensions[SegmentationBackend.ONNX])
+            try:
+                torch.onnx.export(model, example_input, onnx_path, input_names=["image"], output_names=["prediction"],
+                                  dynamic_axes={"image": {0: "batch"}, "prediction": {0: "batch"}})
+                exported_paths.append(onnx_path)
+            except Exception as e:
+                print(f"Could not export ONNX model. {e}")
+
+    return exported_paths
+
+
+def decode_prediction(img_shape, prediction, nms_score=0.3, iou_threshold=0.1, top_k=None, peak_extraction=True):
+    """Decodes a single HRCenterNet output of shape [1, 5, 128, 128] into boxes [K, 4] (top, left, bottom, right)
+    in image coordinates and their scores [K], both already reduced by NMS. The boxes keep the precision they are
+    computed in, so that truncating them to pixels gives the same result as the former per-cell decoder."""
+    output = prediction.detach()[0]
+    heatmap = output[0]
+
+    candidates = heatmap >= nms_score
+    if peak_extraction:  # only keep cells which are the maximum of their 3x3 neighbourhood
+        pooled = torch.nn.functional.max_pool2d(heatmap[None, None], kernel_size=3, stride=1, padding=1)[0, 0]
+        candidates &= heatmap == pooled
+
+    output = output.cpu().numpy()  # the only device-to-host copy
+    # the former per-cell decoder multiplied float32 scalars by Python numbers, which gives float64 before NumPy 2
+    # and float32 since, so the same precision is used here
+    output = output.astype((output.dtype.type(0) * 1.0).dtype, copy=False)
+    rows, cols = np.nonzero(candidates.cpu().numpy())
+
+    scores = output[0, rows, cols]
+    if top_k is not None and len(scores) > top_k:
+        keep = np.sort(np.argpartition(-scores, top_k)[:top_k])
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+    scale_y = img_shape[0] / output_size
+    scale_x = img_shape[1] / output_size
+
+    offset_y = output[1, rows, cols]
+    offset_x = output[2, rows, cols]
+    width = output[3, rows, cols] * output_size * scale_y
+    height = output[4, rows, cols] * output_size * scale_x
+
+    center_row = rows * scale_y + offset_y * scale_x
+    center_col = cols * scale_x + offset_x * scale_y
+
+    boxes = np.stack((center_row - width // 2, center_col - height // 2,
+                      center_row + width // 2, center_col + height // 2), axis=1)
+
+    boxes = torch.from_numpy(boxes)
+    scores = torch.from_numpy(scores).float()
+    nms_index = torchvision.ops.nms(boxes.float(), scores=scores, iou_threshold=iou_threshold)
+    return boxes[nms_index], scores[nms_index]
+
+
+def boxes_to_rectangles(boxes):
+    rectangles = boxes.numpy().astype(int)
+    return [((left, top), (right, bottom)) for top, left, bottom, right in rectangles.tolist()]
+
+
+def get_rectangles(img_shape, prediction, nms_score=0.3, iou_threshold=0.1, top_k=None, peak_extraction=True):
+    boxes, _ = decode_prediction(img_shape, prediction, nms_score, iou_threshold, top_k, peak_extraction)
+    return boxes_to_rectangles(boxes)
+
+
+def image_to_tensor(input_img):
+    # the uint8 image is resized first, so that a float tensor is only allocated at input size
+    input_img = cv2.resize(input_img, (input_size, input_size), interpolation=cv2.INTER_AREA)
     input_img = cv2.cvtColor(input_img, cv2.COLOR_BGR2RGB)
-    input_img = Image.fromarray(input_img).convert("RGB")
+    return torch.from_numpy(input_img).permute(2, 0, 1).contiguous().float().div_(255)
+
 
-    image_tensor = test_tx(input_img)
+def get_raw_prediction(input_img, model):
+    image_tensor = image_to_tensor(input_img)
     image_tensor = image_tensor.unsqueeze_(0)
-    inp = Variable(image_tensor)
+    inp = image_tensor.to(device, dtype=torch.float)
+    with torch.inference_mode():
+        prediction = model(inp)
+    return prediction
+
+
+def get_raw_predictions(input_imgs, model):
+    # all images are resized to the same input size, so that they can be stacked into one [N, 3, 512, 512] batch
+    inp = torch.stack([image_to_tensor(input_img) for input_img in input_imgs])
     inp = inp.to(device, dtype=torch.float)
-    prediction = model(inp)
+    with torch.inference_mode():
+        prediction = model(inp)
     return prediction
 
 
-def predict_boxes(input_img, weights_path):
-    model = load_model(weights_path=weights_path)
-    model.eval()
+def get_tile_starts(length, tile_size, stride):
+    starts = list(range(0, max(length - tile_size, 0) + 1, stride))
+    if starts[-1] + tile_size < length:  # the last tile is aligned to the border of the image
+        starts.append(length - tile_size)
+    return starts
+
+
+def iterate_tiles(input_img, tile_size=input_size, overlap=64):
+    """Yields (x, y, tile) for overlapping square tiles of the image at native resolution. Tiles are views into the
+    image, only tiles of images smaller than tile_size are padded with white."""
+    height, width = input_img.shape[:2]
+    stride = tile_size - overlap
+    for y in get_tile_starts(height, tile_size, stride):
+        for x in get_tile_starts(width, tile_size, stride):
+            tile = input_img[y:y + tile_size, x:x + tile_size]
+            if tile.shape[0] != tile_size or tile.shape[1] != tile_size:
+                tile = cv2.copyMakeBorder(tile, 0, tile_size - tile.shape[0], 0, tile_size - tile.shape[1],
+                                          cv2.BORDER_CONSTANT, value=[255, 255, 255])
+            yield x, y, tile
+
+
+def get_tile_core_mask(boxes, x, y, img_shape, tile_size, overlap):
+    # a box belongs to the tile if its center is not inside the half of an overlap shared with a neighbouring tile
+    center_y = (boxes[:, 0] + boxes[:, 2]) / 2 + y
+    center_x = (boxes[:, 1] + boxes[:, 3]) / 2 + x
+    margin = overlap / 2
+    mask = torch.ones(len(boxes), dtype=torch.bool)
+    if y > 0:
+        mask &= center_y >= y + margin
+    if x > 0:
+        mask &= center_x >= x + margin
+    # at the image border, boxes detected inside the white padding are dropped
+    mask &= center_y < (y + tile_size - margin if y + tile_size < img_shape[0] else img_shape[0])
+    mask &= center_x < (x + tile_size - margin if x + tile_size < img_shape[1] else img_shape[1])
+    return mask
+
+
+def shift_coordinates_by_width(coordinate_list, offset):
+    l = []
+    for element in coordinate_list:
+        l.append(((element[0][0] + offset, element[0][1]), (element[1][0] + offset, element[1][1])))
+    return l
+
+
+class SegmentationCancelled(Exception):
+    pass
+
 
-    raw_prediction = get_raw_prediction(input_img, model)
-    rectangle_list = get_rectangles(input_img.shape, raw_prediction)
+def raise_if_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise SegmentationCancelled()
 
-    return rectangle_list
\ No newline at end of file
+
+def no_progress(done, total):
+    pass
+
+
+class SegmentationCache:
+    """Content-addressed cache of segmentation results on disk. The key is built from the decoded page, the weights
+    file and the decoder parameters, the least recently used entries are evicted when max_size bytes are exceeded."""
+    def __init__(self, cache_dir=SEGMENTATION_CACHE_DIR, max_size=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.weights_hashes = {}
+        '''dict[(weights path, size, modification time)] -> hash of the weights file'''
+        self.total_size = None
+        '''Size of the cache directory as of the last scan plus the entries written since, None before the first scan.
+        Entries written by other processes are only counted by the next scan.'''
+        self.lock = threading.Lock()
+
+    def get_weights_hash(self, weights_path):
+        stat = os.stat(weights_path)
+        weights_key = (weights_path, stat.st_size, stat.st_mtime_ns)
+        if weights_key not in self.weights_hashes:
+            file_hash = hashlib.blake2b(digest_size=16)
+            with open(weights_path, "rb") as file_handle:
+                for chunk in iter(lambda: file_handle.read(1024 * 1024), b""):
+                    file_hash.update(chunk)
+            self.weights_hashes[weights_key] = file_hash.hexdigest()
+        return self.weights_hashes[weights_key]
+
+    def get_key(self, input_img, weights_path, parameters: dict):
+        key_hash = hashlib.blake2b(digest_size=16)
+        key_hash.update(str(input_img.shape).encode())
+        key_hash.update(np.ascontiguousarray(input_img).data)
+        key_hash.update(self.get_weights_hash(weights_path).encode())
+        key_hash.update(json.dumps(parameters, sort_keys=True).encode())
+        return key_hash.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._get_path(key), "r") as file_handle:
+                rectangle_list = json.load(file_handle)
+            os.utime(self._get_path(key))  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return [((x1, y1), (x2, y2)) for (x1, y1), (x2, y2) in rectangle_list]
+
+    def put(self, key, rectangle_list):
+        try:
+            with self.lock:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                if self.total_size is None:
+                    self.evict()
+                # unique across the threads and the worker processes writing to the same directory
+                temporary_path = f"{self._get_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temporary_path, "w") as file_handle:
+                    json.dump(rectangle_list, file_handle)
+                try:
+                    replaced_size = os.path.getsize(self._get_path(key))
+                except OSError:
+                    replaced_size = 0
+                self.total_size += os.path.getsize(temporary_path) - replaced_size
+                os.replace(temporary_path, self._get_path(key))  # readers never see a half written entry
+                if self.total_size > self.max_size:
+                    self.evict()
+        except OSError as e:
+            print(f"Could not write segmentation to cache directory {self.cache_dir}. {e}")
+
+    def evict(self):
+        """Scans the cache directory and updates total_size. If max_size is exceeded, the least recently used entries
+        are removed down to 90% of max_size, so that the next scan is only needed after a number of further writes."""
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".json"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, file_name))
+                    entries.append((stat.st_mtime_ns, stat.st_size, file_name))
+                except FileNotFoundError:  # evicted by another process in the meantime
+                    pass
+
+        total_size = sum(size for _, size, _ in entries)
+        target_size = self.max_size if total_size <= self.max_size else 0.9 * self.max_size
+        for _, size, file_name in sorted(entries):
+            if total_size <= target_size:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, file_name))
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        self.total_size = total_size
+
+    def clear(self):
+        with self.lock:
+            if os.path.isdir(self.cache_dir):
+                for file_name in os.listdir(self.cache_dir):
+                    if file_name.endswith(".json"):
+                        os.remove(os.path.join(self.cache_dir, file_name))
+            self.total_size = 0
+
+
+class SegmentationEngine:
+    def __init__(self, warm_up=False, cache: SegmentationCache = None, backend=SegmentationBackend.AUTO):
+        self.models = {}
+        '''dict[model key] -> (the loaded model in eval mode, the backend that was actually loaded)'''
+        self.backend = backend
+        '''The SegmentationBackend, in auto mode exported models are preferred if they exist'''
+        self.warm_up = warm_up
+        '''If true, each model runs a dummy forward pass directly after loading'''
+        self.cache = cache
+        '''If not None, results are looked up here before running the network'''
+        self.decoder_parameters = {"nms_score": 0.3, "iou_threshold": 0.1, "top_k": None, "peak_extraction": True}
+        self.lock = threading.Lock()
+
+    def get_model_key(self, weights_path):
+        """(weights path, selected backend, size and mtime of the exported model), so that a re-exported model is
+        loaded again."""
+        backend = select_backend(weights_path, self.backend)
+        if backend == SegmentationBackend.EAGER:
+            return weights_path, backend, None
+        try:
+            stat = os.stat(get_exported_model_path(weights_path, exported_model_extensions[backend]))
+        except OSError:  # the exported model is missing, load_model_with_backend would load the eager model
+            return weights_path, SegmentationBackend.EAGER, None
+        return weights_path, backend, (stat.st_size, stat.st_mtime_ns)
+
+    def load(self, weights_path):
+        """Returns the model and the backend that was actually loaded, which is the eager backend if the exported
+        model could not be loaded."""
+        with self.lock:
+            model_key = self.get_model_key(weights_path)
+            if model_key not in self.models:
+                model = load_model_with_backend(weights_path, model_key[1])
+                if model is None:
+                    return None, None
+                model.eval()
+                if self.warm_up:
+                    warm_up_model(model)
+                loaded_backend = SegmentationBackend.EAGER if isinstance(model, segmentation_net) else model_key[1]
+                # a model loaded from an outdated export is replaced
+                self.models = {key: value for key, value in self.models.items() if key[:2] != model_key[:2]}
+                self.models[model_key] = (model, loaded_backend)
+            return self.models[model_key]
+
+    def get_model(self, weights_path):
+        return self.load(weights_path)[0]
+
+    def unload(self, weights_path=None):
+        with self.lock:
+            if weights_path is None:
+                self.models = {}
+            else:
+                self.models = {key: model for key, model in self.models.items() if key[0] != weights_path}
+
+    def get_cache_key(self, input_img, weights_path, **parameters):
+        if self.cache is None:
+            return None
+        # results of different backends differ slightly (e.g., float vs int8), so they are cached separately
+        backend = self.get_model_key(weights_path)[1]
+        if backend != SegmentationBackend.EAGER:
+            # only loading the exported model shows whether it is used or the eager fallback
+            backend = self.load(weights_path)[1]
+            if backend is None:
+                return None
+        backend_parameters = {"backend": backend}
+        if backend != SegmentationBackend.EAGER:
+            exported_path = get_exported_model_path(weights_path, exported_model_extensions[backend])
+            try:
+                backend_parameters["exported_model"] = self.cache.get_weights_hash(exported_path)
+            except OSError:  # the exported model was removed after loading
+                return None
+        return self.cache.get_key(input_img, weights_path, {**self.decoder_parameters, **backend_parameters,
+                                                            "preprocessing": preprocessing_version, **parameters})
+
+    def lookup(self, cache_key):
+        if cache_key is None:
+            return None
+        return self.cache.get(cache_key)
+
+    def store(self, cache_key, rectangle_list):
+        if cache_key is not None:
+            self.cache.put(cache_key, rectangle_list)
+
+    def predict_boxes(self, input_img, weights_path, on_progress=no_progress, cancel_event=None):
+        cache_key = self.get_cache_key(input_img, weights_path, mode="resized")
+        rectangle_list = self.lookup(cache_key)
+        if rectangle_list is None:
+            model = self.get_model(weights_path)
+            if model is None:
+                return []
+
+            raise_if_cancelled(cancel_event)
+            raw_prediction = get_raw_prediction(input_img, model)
+            rectangle_list = get_rectangles(input_img.shape, raw_prediction, **self.decoder_parameters)
+            self.store(cache_key, rectangle_list)
+        on_progress(1, 1)
+
+        return rectangle_list
+
+    def predict_boxes_batch(self, input_imgs, weights_path, batch_size=8, on_progress=no_progress, cancel_event=None):
+        """Segments a list of images, which may also belong to different pieces, with batched forward passes.
+        Returns one rectangle list per image."""
+        cache_keys = []
+        for input_img in input_imgs:  # hashing a page takes a while, so cancellation is checked for every page
+            raise_if_cancelled(cancel_event)
+            cache_keys.append(self.get_cache_key(input_img, weights_path, mode="resized"))
+        rectangle_lists = [self.lookup(cache_key) for cache_key in cache_keys]
+        missing_idxs = [idx for idx, rectangle_list in enumerate(rectangle_lists) if rectangle_list is None]
+        on_progress(len(input_imgs) - len(missing_idxs), len(input_imgs))
+
+        if missing_idxs:
+            model = self.get_model(weights_path)
+            if model is None:
+                return [[] for _ in input_imgs]
+
+        for start in range(0, len(missing_idxs), batch_size):  # only the images missing in the cache are segmented
+            raise_if_cancelled(cancel_event)
+            batch_idxs = missing_idxs[start:start + batch_size]
+            raw_prediction = get_raw_predictions([input_imgs[idx] for idx in batch_idxs], model)
+            for batch_position, idx in enumerate(batch_idxs):
+                raise_if_cancelled(cancel_event)
+                rectangle_lists[idx] = get_rectangles(input_imgs[idx].shape,
+                                                      raw_prediction[batch_position:batch_position + 1],
+                                                      **self.decoder_parameters)
+                self.store(cache_keys[idx], rectangle_lists[idx])
+                on_progress(len(input_imgs) - len(missing_idxs) + start + batch_position + 1, len(input_imgs))
+
+        return rectangle_lists
+
+    def predict_boxes_tiled(self, input_img, weights_path, tile_size=input_size, overlap=64, batch_size=8,
+                            cancel_event=None):
+        """Segments the image at native resolution with overlapping tiles instead of resizing it to the input size.
+        Only batch_size tiles are in memory at once, the boxes of all tiles are merged with a global NMS."""
+        raise_if_cancelled(cancel_event)
+        cache_key = self.get_cache_key(input_img, weights_path, mode="tiled", tile_size=tile_size, overlap=overlap)
+        rectangle_list = self.lookup(cache_key)
+        if rectangle_list is not None:
+            return rectangle_list
+
+        model = self.get_model(weights_path)
+        if model is None:
+            return []
+        iou_threshold = self.decoder_parameters["iou_threshold"]
+
+        box_list = []
+        score_list = []
+
+        def process(batch, positions):
+            raise_if_cancelled(cancel_event)
+            raw_prediction = get_raw_predictions(batch, model)
+            for idx, (x, y) in enumerate(positions):
+                raise_if_cancelled(cancel_event)
+                boxes, scores = decode_prediction((tile_size, tile_size), raw_prediction[idx:idx + 1],
+                                                  **self.decoder_parameters)
+                mask = get_tile_core_mask(boxes, x, y, input_img.shape, tile_size, overlap)
+                box_list.append(boxes[mask].float() + torch.tensor([y, x, y, x], dtype=torch.float))
+                score_list.append(scores[mask])
+
+        batch, positions = [], []
+        for x, y, tile in iterate_tiles(input_img, tile_size, overlap):
+            batch.append(tile)
+            positions.append((x, y))
+            if len(batch) == batch_size:
+                process(batch, positions)
+                batch, positions = [], []
+        if batch:
+            process(batch, positions)
+
+        boxes = torch.cat(box_list)
+        scores = torch.cat(score_list)
+        nms_index = torchvision.ops.nms(boxes, scores=scores, iou_threshold=iou_threshold)
+        rectangle_list = boxes_to_rectangles(boxes[nms_index])
+        self.store(cache_key, rectangle_list)
+        return rectangle_list
+
+    def predict_pages(self, pages, weights_path, batch_size=8, tiled=False, on_progress=no_progress,
+                      cancel_event=None):
+        """Segments the pages of a piece individually and returns the boxes in the coordinates of the pages
+        placed next to each other."""
+        if tiled:
+            rectangle_lists = []
+            for page in pages:
+                raise_if_cancelled(cancel_event)
+                rectangle_lists.append(self.predict_boxes_tiled(page, weights_path, batch_size=batch_size,
+                                                                cancel_event=cancel_event))
+                on_progress(len(rectangle_lists), len(pages))
+        else:
+            rectangle_lists = self.predict_boxes_batch(pages, weights_path, batch_size, on_progress, cancel_event)
+
+        boxes = []
+        current_width_offset = 0
+        for page, rectangle_list in zip(pages, rectangle_lists):
+            boxes += shift_coordinates_by_width(rectangle_list, current_width_offset)
+            current_width_offset += page.shape[1]
+        return boxes
+
+
+class SegmentationTask:
+    """Runs one of the prediction functions of SegmentationEngine on a worker thread. The GUI polls progress and
+    result instead of waiting for the segmentation."""
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_event = threading.Event()
+        self.progress = (0, 0)
+        '''(number of finished pages, number of all pages)'''
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            self.result = self.function(*self.args, on_progress=self._set_progress, cancel_event=self.cancel_event,
+                                        **self.kwargs)
+        except SegmentationCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+
+    def _set_progress(self, done, total):
+        self.progress = (done, total)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def is_done(self):
+        return not self.thread.is_alive()
+
+
+def warm_up_model(model):
+    dummy_input = torch.zeros((1, 3, input_size, input_size), dtype=torch.float, device=device)
+    with torch.inference_mode():
+        model(dummy_input)
+
+
+segmentation_engine = SegmentationEngine(cache=SegmentationCache() if USE_SEGMENTATION_CACHE else None)
+'''Engine of the annotation editor, every weights file is only loaded once'''
+
+
+def predict_boxes(input_img, weights_path):
+    return segmentation_engine.predict_boxes(input_img, weights_path)
\ No newline at end of file
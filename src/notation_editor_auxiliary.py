@@ -153,7 +153,6 @@ class DisplayState:
         self._delete_button = None
 
         self.image_to_save = None
-        self.image_to_draw = None
         self.idx_boxes = None
 
         self.config_music_listframe()
@@ -842,6 +841,11 @@ class NotationOpenCvWindow:
         self.point_1 = None
         self.point_2 = None
         self.notation_state = notation_state
+        self.image_to_draw = None
+        self.drawn_frame = None
+        '''(image to save, selection) shown in the window, which is only redrawn if one of them changes'''
+        self.on_input = lambda: None
+        '''Called on every mouse event, e.g., to schedule the next frame'''
 
         cv2.namedWindow(self.window_name, cv2.WINDOW_GUI_NORMAL)
         cv2.resizeWindow(self.window_name, 600, 600)
@@ -863,6 +867,8 @@ class NotationOpenCvWindow:
             self.point_2 = (x, y)
             self.current_click_coordinates = None
 
+        self.on_input()
+
     def draw_and_handle_clicks(self, image, idx_boxes):
         keypress = cv2.waitKey(1)
 
@@ -886,14 +892,19 @@ class NotationOpenCvWindow:
 
         on_right_click()
 
-        if image is not None:
+        selection = self.notation_state.get_current_selection()
+        is_changed = image is not None and (self.drawn_frame is None or image is not self.drawn_frame[0]
+                                            or selection != self.drawn_frame[1])
+        if is_changed:
+            self.drawn_frame = (image, selection)
+            image = self.image_to_draw = image.copy()  # the image to save stays without the highlighted note
 
             ## DEBUG BOXES ##
             #for idx, box in enumerate(idx_boxes):
             #    image_to_draw = cv2.rectangle(image_to_draw, box[0], box[1], (255, 0, 0), 2)
 
             try:
-                box = idx_boxes[self.notation_state.get_current_selection()]
+                box = idx_boxes[selection]
                 #rect_image = cv2.rectangle(image_to_draw,  box[0], box[1], (255, 255, 200), -1)
                 sub_img = image[box[0][1]:box[1][1], box[0][0]:box[1][0]]
                 color = np.ones(sub_img.shape, dtype=np.uint8)
@@ -904,3 +915,5 @@ class NotationOpenCvWindow:
             except TypeError:
                 pass
             cv2.imshow(self.window_name, image)
+
+        return is_changed or keypress != -1
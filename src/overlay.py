@@ -0,0 +1,60 @@
+import cv2
+
+from src.auxiliary import draw_transparent_rectangle, draw_transparent_line, get_bounding_rect
+
+
+class OverlayCompositor:
+    """Draws transient overlays (ruler, drag rectangle, highlights) on top of a retained base layer. Only the bounding
+    rectangles of the overlays are touched: the ones of the last frame are restored from the base layer, the new ones
+    are drawn (or blended, if they are transparent) in place."""
+    def __init__(self):
+        self.overlays = []
+        '''The overlays of the current frame, as (draw function, points, color, thickness, alpha)'''
+        self.dirty_rects = []
+        '''The rectangles covered by the overlays of the last composed frame'''
+        self.last_overlays = None
+        '''The overlays of the last composed frame, None if the image has been reset to the base layer since'''
+
+    def clear(self):
+        self.overlays = []
+
+    def invalidate(self):
+        """Must be called when the image has been reset to the base layer, so nothing needs to be restored."""
+        self.dirty_rects = []
+        self.last_overlays = None
+
+    def add_rectangle(self, point_1, point_2, color, thickness, alpha=None):
+        self.overlays.append((draw_transparent_rectangle if alpha is not None else cv2.rectangle,
+                              (point_1, point_2), color, thickness, alpha))
+
+    def add_line(self, point_1, point_2, color, thickness, alpha=None):
+        self.overlays.append((draw_transparent_line if alpha is not None else cv2.line,
+                              (point_1, point_2), color, thickness, alpha))
+
+    def compose(self, image, base_layer, to_window=lambda point: point, scale=1.0):
+        """Composes the overlays of the current frame onto image, which shows base_layer and the overlays of the last
+        frame. The points of the overlays are mapped with to_window and their thickness is multiplied by scale, e.g.,
+        for a zoomed viewport. Returns True if the image has been changed, i.e., not if the overlays are the same as in
+        the last frame (e.g., the ruler below a resting mouse) and the image has not been reset since."""
+        if self.overlays == self.last_overlays:
+            return False
+        self.last_overlays = list(self.overlays)
+
+        is_changed = bool(self.dirty_rects)
+        for x1, y1, x2, y2 in self.dirty_rects:
+            image[y1:y2, x1:x2] = base_layer[y1:y2, x1:x2]
+        self.dirty_rects = []
+
+        for draw_function, points, color, thickness, alpha in self.overlays:
+            points = [to_window(point) for point in points]
+            thickness = max(int(round(thickness * scale)), 1)
+            rect = get_bounding_rect(points, thickness, image.shape)
+            if rect is None:
+                continue
+            if alpha is None:
+                draw_function(image, *points, color, thickness)
+            else:
+                draw_function(image, *points, color, thickness, alpha)
+            self.dirty_rects.append(rect)
+            is_changed = True
+        return is_changed
@@ -1,6 +1,7 @@
 import dataclasses
 import importlib
 import tkinter as tk
+import types
 
 import chinese_converter
 
@@ -246,20 +247,7 @@ class Lvlv:
     @classmethod
     def to_int(cls, lvlv):
         try:
-            return {
-                cls.HUANGZHONG: 0,
-                cls.DALV: 1,
-                cls.TAICU: 2,
-                cls.JIAZHONG: 3,
-                cls.GUXIAN: 4,
-                cls.ZHONGLV: 5,
-                cls.RUIBIN: 6,
-                cls.LINZHONG: 7,
-                cls.YIZE: 8,
-                cls.NANLV: 9,
-                cls.WUYI: 10,
-                cls.YINGZHONG: 11,
-            }[lvlv]
+            return LVLV_TO_INT[lvlv]
         except KeyError:
             print(f"'{lvlv}' is not a valid lülü")
             return 0
@@ -267,26 +255,21 @@ class Lvlv:
     @classmethod
     def from_int(cls, int):
         try:
-            return {
-                0: cls.HUANGZHONG,
-                1: cls.DALV,
-                2: cls.TAICU,
-                3: cls.JIAZHONG,
-                4: cls.GUXIAN,
-                5: cls.ZHONGLV,
-                6: cls.RUIBIN,
-                7: cls.LINZHONG,
-                8: cls.YIZE,
-                9: cls.NANLV,
-                10: cls.WUYI,
-                11: cls.YINGZHONG,
-            }[int]
+            return INT_TO_LVLV[int]
         except KeyError:
             print(f"'{int}' is not a valid lülü int")
             return cls.HUANGZHONG
 
 
-def get_tone_inventory(lvlv):
+GONGCHE_MELODY_SYMBOLS = dataclasses.astuple(GongcheMelodySymbol())
+'''All gongche melody symbols, ordered by pitch'''
+LVLV_LIST = dataclasses.astuple(Lvlv())
+'''All lülü, ordered by pitch, i.e., LVLV_LIST[Lvlv.to_int(lvlv)] == lvlv'''
+LVLV_TO_INT = types.MappingProxyType({lvlv: idx for idx, lvlv in enumerate(LVLV_LIST)})
+INT_TO_LVLV = types.MappingProxyType(dict(enumerate(LVLV_LIST)))
+
+
+def _create_tone_inventory(lvlv):
     def rotate_list_right(l, idx):
         return [l[(index - idx + len(l)) % len(l)] for index in range(len(l))]
 
@@ -294,15 +277,11 @@ def get_tone_inventory(lvlv):
         return l + l[0:4]
 
     huang_zhong_gong = ["宫", None, "商", None, "角", None, "变", "徵", None, "羽", None, "闰"]
-    return extend_tone_inventory(rotate_list_right(huang_zhong_gong, Lvlv.to_int(lvlv)))
-
+    return tuple(extend_tone_inventory(rotate_list_right(huang_zhong_gong, LVLV_TO_INT[lvlv])))
 
-def tone_inventory_convert_pitch(gong_lvlv, pitch: GongcheMelodySymbol):
-    tone_inventory = get_tone_inventory(gong_lvlv)
-    def raise_error():
-        print(f"Error! Incompatible symbol {pitch} according to tone inventory {tone_inventory}.")
-        #raise RuntimeError(f"Error! Incompatible symbol {pitch} according to tone inventory {gong_lvlv}.")
 
+def _convert_pitch(tone_inventory, pitch: GongcheMelodySymbol):
+    """Returns the pitch meant by the (suzipu) symbol in the tone inventory, or None if it is incompatible."""
     if pitch == None:
         return None
     # Here, we flip the order, because for Nanlüdiao we need the diatonic steps
@@ -350,16 +329,59 @@ def tone_inventory_convert_pitch(gong_lvlv, pitch: GongcheMelodySymbol):
         #if gong_lvlv[15] is not None:
         return pitch
 
-    raise_error()
+    return None
 
 
-def tone_inventory_check_pitch(gong_lvlv, pitch: GongcheMelodySymbol):
-    tone_inventory = get_tone_inventory(gong_lvlv)
+def _create_pitch_conversion(tone_inventory):
+    conversion = {None: None}
+    for pitch in GONGCHE_MELODY_SYMBOLS:
+        converted_pitch = _convert_pitch(tone_inventory, pitch)
+        if converted_pitch is not None:
+            conversion[pitch] = converted_pitch
+    return types.MappingProxyType(conversion)
+
 
-    for idx, cmp_pitch in enumerate(dataclasses.astuple(GongcheMelodySymbol())):
-        if pitch == cmp_pitch and tone_inventory[idx] is not None:
-            return True
-    return False
+# the tables are shared by all callers, so they are read-only
+TONE_INVENTORY_TABLE = types.MappingProxyType({lvlv: _create_tone_inventory(lvlv) for lvlv in LVLV_LIST})
+'''mapping[lvlv] -> tuple of the scale degree names (or None) of the 16 gongche melody symbols'''
+TONE_INVENTORY_PITCHES = types.MappingProxyType({
+    lvlv: frozenset(pitch for pitch, degree in zip(GONGCHE_MELODY_SYMBOLS, tone_inventory) if degree is not None)
+    for lvlv, tone_inventory in TONE_INVENTORY_TABLE.items()})
+'''mapping[lvlv] -> frozenset of the gongche melody symbols belonging to the tone inventory'''
+PITCH_CONVERSION_TABLE = types.MappingProxyType({lvlv: _create_pitch_conversion(tone_inventory)
+                                                 for lvlv, tone_inventory in TONE_INVENTORY_TABLE.items()})
+'''mapping[lvlv] -> mapping[gongche melody symbol] -> converted symbol, i.e., the 12x16 table of all compatible
+conversions'''
+
+
+def get_tone_inventory(lvlv):
+    try:
+        return TONE_INVENTORY_TABLE[lvlv]
+    except KeyError:
+        return TONE_INVENTORY_TABLE[Lvlv.from_int(Lvlv.to_int(lvlv))]  # prints the error, uses Huangzhong instead
+
+
+def tone_inventory_convert_pitch(gong_lvlv, pitch: GongcheMelodySymbol):
+    try:
+        return PITCH_CONVERSION_TABLE[gong_lvlv][pitch]
+    except (KeyError, TypeError):
+        tone_inventory = get_tone_inventory(gong_lvlv)
+        converted_pitch = _convert_pitch(tone_inventory, pitch)
+        if pitch is not None and converted_pitch is None:
+            print(f"Error! Incompatible symbol {pitch} according to tone inventory {list(tone_inventory)}.")
+            #raise RuntimeError(f"Error! Incompatible symbol {pitch} according to tone inventory {gong_lvlv}.")
+        return converted_pitch
+
+
+def tone_inventory_check_pitch(gong_lvlv, pitch: GongcheMelodySymbol):
+    try:
+        pitches = TONE_INVENTORY_PITCHES[gong_lvlv]
+    except KeyError:
+        pitches = TONE_INVENTORY_PITCHES[Lvlv.from_int(Lvlv.to_int(gong_lvlv))]
+    try:
+        return pitch in pitches
+    except TypeError:
+        return False
 
 
 class GongdiaoMode:
@@ -385,13 +407,21 @@ class GongdiaoMode:
         return tone_inventory_convert_pitch(self.gong_lvlv, pitch)
 
     def convert_pitches_in_list(self, original_list):
+        conversion = PITCH_CONVERSION_TABLE.get(self.gong_lvlv, {})  # the row of the mode, looked up once
+
+        def convert(pitch):
+            try:
+                return conversion[pitch]
+            except (KeyError, TypeError):
+                return self.convert_pitch(pitch)  # incompatible or invalid pitch, prints the error
+
         new_list = []
-        for idx in range(len(original_list)):
+        for notation in original_list:
             try:
-                if "secondary" in original_list[idx].keys():
-                    new_list.append({"pitch": self.convert_pitch(original_list[idx]["pitch"]), "secondary": original_list[idx]["secondary"]})
+                if "secondary" in notation.keys():
+                    new_list.append({"pitch": convert(notation["pitch"]), "secondary": notation["secondary"]})
                 else:
-                    new_list.append({"pitch": self.convert_pitch(original_list[idx]["pitch"])})
+                    new_list.append({"pitch": convert(notation["pitch"])})
             except AttributeError:
                 new_list.append({"pitch": None})
         return new_list
@@ -444,9 +474,10 @@ class GongdiaoModeList:
 
     @classmethod
     def from_string(cls, string):
-        for mode in dataclasses.astuple(cls()):
-            if string == mode.name or string == mode.chinese_name:
-                return mode
+        try:
+            return GONGDIAO_MODE_BY_NAME[string]
+        except (KeyError, TypeError):
+            pass
         NO_MODE = GongdiaoMode("!!! NO MODE !!!", "！！！没有宫调！！！", Lvlv.HUANGZHONG, GongdiaoStep.GONG)
         #print(f"Could not construct mode from string '{string}'. Returned {cls.NO_MODE.name} instead.")  # TODO: activate?
         return NO_MODE
@@ -457,9 +488,8 @@ class GongdiaoModeList:
             gong_lvlv = mode_properties["gong_lvlv"]
             final_note = mode_properties["final_note"]
 
-            for mode in dataclasses.astuple(cls()):  # first, check if there is already a name stored for this mode
-                if mode.gong_lvlv == gong_lvlv and mode.final_note == final_note:
-                    return mode
+            if (gong_lvlv, final_note) in GONGDIAO_MODE_BY_PROPERTIES:  # first, check if there is already a name stored for this mode
+                return GONGDIAO_MODE_BY_PROPERTIES[(gong_lvlv, final_note)]
 
             # otherwise, construct a name for it
             return GongdiaoMode(f"{Lvlv.to_name(gong_lvlv)}均 -- final：{final_note}", f"{Lvlv.to_name(gong_lvlv)}均 -- final：{final_note}", gong_lvlv, final_note)
@@ -467,6 +497,24 @@ class GongdiaoModeList:
             return GongdiaoModeList.NO_MODE
 
 
+GONGDIAO_MODES = tuple(getattr(GongdiaoModeList, field.name) for field in dataclasses.fields(GongdiaoModeList))
+'''All predefined modes, in the order of GongdiaoModeList'''
+
+
+def _create_mode_lookups():
+    by_name = {}
+    by_properties = {}
+    for mode in GONGDIAO_MODES:  # the first mode wins, as in a linear search
+        by_name.setdefault(mode.name, mode)
+        by_name.setdefault(mode.chinese_name, mode)
+        by_properties.setdefault((mode.gong_lvlv, mode.final_note), mode)
+    return types.MappingProxyType(by_name), types.MappingProxyType(by_properties)
+
+
+GONGDIAO_MODE_BY_NAME, GONGDIAO_MODE_BY_PROPERTIES = _create_mode_lookups()
+'''Read-only mappings from the (English or Chinese) name and from (gong lvlv, final note) to the predefined mode'''
+
+
 class NotationDisplayTypes:
     NOTATION_SPECIFIC: str = "Notation Specific"
     JIANPU: str = "Jianpu"
@@ -480,6 +528,7 @@ class DisplayNotesFrame:
         self.on_save_musicxml = on_save_musicxml
         self.frame = tk.LabelFrame(self.window_handle, text="Modern Notation")
         self._image = None
+        self._image_on_canvas = None
 
         self.canvas = tk.Canvas(self.frame, relief="sunken", state="disabled")
         hbar = tk.Scrollbar(self.frame, orient=tk.HORIZONTAL)
@@ -560,9 +609,13 @@ class DisplayNotesFrame:
             widget.config(state=state)
 
     def set_image(self, image):
+        if image is self._image:  # the preview is set periodically, mostly with the unchanged image
+            return
         self._image = image
-        image_on_canvas = self.canvas.create_image(0, 0, image=self._image, anchor="nw")
-        #self.canvas.itemconfig(image_on_canvas, image=self._image)
+        if self._image_on_canvas is None:
+            self._image_on_canvas = self.canvas.create_image(0, 0, image=self._image, anchor="nw")
+        else:
+            self.canvas.itemconfig(self._image_on_canvas, image=self._image)
         self.canvas.config(width=self._image.width() if self._image.width() < 1400 else 1400, height=self._image.height() if self._image.height() < 700 else 700)
 
     def get_frame(self):
@@ -709,7 +762,7 @@ class NoteFrames:
 
         for idx in range(len(self.scale_degree_vars_list)):
             scale_degree = tone_inventory[idx] if tone_inventory[idx] else ""
-            gongche_melody_symbol = dataclasses.astuple(GongcheMelodySymbol())[idx]
+            gongche_melody_symbol = GONGCHE_MELODY_SYMBOLS[idx]
 
             pitch = gongche_melody_symbol if gongche_melody_symbol == mode.convert_pitch(gongche_melody_symbol) else None
 
@@ -847,7 +900,7 @@ class ModeSelectorFrame:
                         self.mode_display_frame.update()
 
         sub_frame = tk.Frame(self.frame)
-        mode_names = [mode.name for mode in dataclasses.astuple(GongdiaoModeList())]
+        mode_names = [mode.name for mode in GONGDIAO_MODES]
         mode_menu = tk.OptionMenu(sub_frame, self.mode_variable, "", *mode_names, command=on_update_mode_properties)
         infer_mode_button = tk.Button(sub_frame, text="Infer Mode from Segmentation Boxes", command=on_infer_mode)
         custom_mode_button = tk.Button(sub_frame, text="Custom Mode Picker", command=on_custom_mode)
@@ -1020,37 +1073,38 @@ def _create_suzipu_images():
     return dictionary
 
 
-def suzipu_to_info(suzipu_base_symbol) -> SuzipuProperties:
-    suzipu_to_info_dict = {
-        GongcheMelodySymbol.HE: SuzipuProperties("He", "合", "he.png", "C4"),
-        GongcheMelodySymbol.XIA_SI: SuzipuProperties("Xia Si", "下四", "si.png", "Db4"),
-        GongcheMelodySymbol.SI: SuzipuProperties("Si", "四", "si.png", "D4"),
-        GongcheMelodySymbol.XIA_YI: SuzipuProperties("Xia Yi", "下一", "yi.png", "Eb4"),
-        GongcheMelodySymbol.YI: SuzipuProperties("Yi", "一", "yi.png", "E4"),
-        GongcheMelodySymbol.SHANG: SuzipuProperties("Shang", "上", "shang.png", "F4"),
-        GongcheMelodySymbol.GOU: SuzipuProperties("Gou", "勾", "gou.png", "F#4"),
-        GongcheMelodySymbol.CHE: SuzipuProperties("Che", "尺", "che.png", "G4"),
-        GongcheMelodySymbol.XIA_GONG: SuzipuProperties("Xia Gong", "下工", "gong.png", "Ab4"),
-        GongcheMelodySymbol.GONG: SuzipuProperties("Gong", "工", "gong.png", "A4"),
-        GongcheMelodySymbol.XIA_FAN: SuzipuProperties("Xia Fan", "下凡", "fan.png", "Bb4"),
-        GongcheMelodySymbol.FAN: SuzipuProperties("Fan", "凡", "fan.png", "B4"),
-        GongcheMelodySymbol.LIU: SuzipuProperties("Liu", "六", "liu.png", "C5"),
-        GongcheMelodySymbol.XIA_WU: SuzipuProperties("Xia Wu", "下五", "wu.png", "Db5"),
-        GongcheMelodySymbol.WU: SuzipuProperties("Wu", "五", "wu.png", "D5"),
-        GongcheMelodySymbol.GAO_WU: SuzipuProperties("Gao Wu", "高五", "gao_wu.png", "Eb5"),
-
-        SuzipuAdditionalSymbol.ADD_DA_DUN: SuzipuProperties("ADD_Dadun", "大顿", "add_dadun.png"),
-        SuzipuAdditionalSymbol.ADD_XIAO_ZHU: SuzipuProperties("ADD_Xiaozhu", "小住", "add_xiaozhu.png"),
-        SuzipuAdditionalSymbol.ADD_DING_ZHU: SuzipuProperties("ADD_Dingzhu", "丁住", "add_dingzhu.png"),
-        SuzipuAdditionalSymbol.ADD_DA_ZHU: SuzipuProperties("ADD_Dazhu", "大住", "add_dazhu.png"),
-        SuzipuAdditionalSymbol.ADD_ZHE: SuzipuProperties("ADD_Zhe", "折", "add_zhe.png"),
-        SuzipuAdditionalSymbol.ADD_YE: SuzipuProperties("ADD_Ye", "拽", "add_ye.png"),
-
-        Symbol.NONE: SuzipuProperties("None", "None", "none.png"),
-        Symbol.ERROR: SuzipuProperties("None", "None", "error.png"),
-    }
+SUZIPU_TO_INFO = types.MappingProxyType({
+    GongcheMelodySymbol.HE: SuzipuProperties("He", "合", "he.png", "C4"),
+    GongcheMelodySymbol.XIA_SI: SuzipuProperties("Xia Si", "下四", "si.png", "Db4"),
+    GongcheMelodySymbol.SI: SuzipuProperties("Si", "四", "si.png", "D4"),
+    GongcheMelodySymbol.XIA_YI: SuzipuProperties("Xia Yi", "下一", "yi.png", "Eb4"),
+    GongcheMelodySymbol.YI: SuzipuProperties("Yi", "一", "yi.png", "E4"),
+    GongcheMelodySymbol.SHANG: SuzipuProperties("Shang", "上", "shang.png", "F4"),
+    GongcheMelodySymbol.GOU: SuzipuProperties("Gou", "勾", "gou.png", "F#4"),
+    GongcheMelodySymbol.CHE: SuzipuProperties("Che", "尺", "che.png", "G4"),
+    GongcheMelodySymbol.XIA_GONG: SuzipuProperties("Xia Gong", "下工", "gong.png", "Ab4"),
+    GongcheMelodySymbol.GONG: SuzipuProperties("Gong", "工", "gong.png", "A4"),
+    GongcheMelodySymbol.XIA_FAN: SuzipuProperties("Xia Fan", "下凡", "fan.png", "Bb4"),
+    GongcheMelodySymbol.FAN: SuzipuProperties("Fan", "凡", "fan.png", "B4"),
+    GongcheMelodySymbol.LIU: SuzipuProperties("Liu", "六", "liu.png", "C5"),
+    GongcheMelodySymbol.XIA_WU: SuzipuProperties("Xia Wu", "下五", "wu.png", "Db5"),
+    GongcheMelodySymbol.WU: SuzipuProperties("Wu", "五", "wu.png", "D5"),
+    GongcheMelodySymbol.GAO_WU: SuzipuProperties("Gao Wu", "高五", "gao_wu.png", "Eb5"),
+
+    SuzipuAdditionalSymbol.ADD_DA_DUN: SuzipuProperties("ADD_Dadun", "大顿", "add_dadun.png"),
+    SuzipuAdditionalSymbol.ADD_XIAO_ZHU: SuzipuProperties("ADD_Xiaozhu", "小住", "add_xiaozhu.png"),
+    SuzipuAdditionalSymbol.ADD_DING_ZHU: SuzipuProperties("ADD_Dingzhu", "丁住", "add_dingzhu.png"),
+    SuzipuAdditionalSymbol.ADD_DA_ZHU: SuzipuProperties("ADD_Dazhu", "大住", "add_dazhu.png"),
+    SuzipuAdditionalSymbol.ADD_ZHE: SuzipuProperties("ADD_Zhe", "折", "add_zhe.png"),
+    SuzipuAdditionalSymbol.ADD_YE: SuzipuProperties("ADD_Ye", "拽", "add_ye.png"),
+
+    Symbol.NONE: SuzipuProperties("None", "None", "none.png"),
+    Symbol.ERROR: SuzipuProperties("None", "None", "error.png"),
+})
 
+
+def suzipu_to_info(suzipu_base_symbol) -> SuzipuProperties:
     try:
-        return suzipu_to_info_dict[suzipu_base_symbol]
+        return SUZIPU_TO_INFO[suzipu_base_symbol]
     except KeyError as e:
         print(f"Expected Suzipu base symbol string, but received {suzipu_base_symbol}. {e}")
@@ -0,0 +1,166 @@
+import dataclasses
+
+from src.fingering import Fingering
+from src.plugins.suzipu_lvlvpu_gongchepu.common import GongcheMelodySymbol, SuzipuAdditionalSymbol, suzipu_to_info
+
+
+STEPS = "CDEFGAB"
+STEP_TO_SEMITONE = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+ALTER_TO_ACCIDENTAL = {-2: "double_flat", -1: "flat", 0: None, 1: "sharp", 2: "double_sharp"}
+'''Maps the alteration in semitones to the accidental names used for the notation images'''
+
+
+class DisplayPitch:
+    """Minimal, immutable pitch (step, alteration in semitones, octave) with the spelling rules of music21, which is
+    all the image renderers need."""
+    __slots__ = ("step", "alter", "octave")
+
+    def __init__(self, step, alter, octave):
+        self.step = step
+        self.alter = alter
+        self.octave = octave
+
+    @classmethod
+    def from_string(cls, string):
+        """Parses names like 'C4', 'F#4' or 'Bb4'."""
+        step, accidentals, octave = string[0], string[1:-1], int(string[-1])
+        return cls(step, accidentals.count("#") - accidentals.count("b") - accidentals.count("-"), octave)
+
+    @property
+    def midi(self):
+        return 12 * (self.octave + 1) + STEP_TO_SEMITONE[self.step] + self.alter
+
+    @property
+    def accidental(self):
+        return ALTER_TO_ACCIDENTAL[self.alter]
+
+    def transpose(self, interval: str):
+        """Transposes by an interval given by its music21 name, e.g., 'P8', '-m7' or 'M2'."""
+        direction = -1 if interval.startswith("-") else 1
+        quality, number = interval.lstrip("-")[0], int(interval.lstrip("-")[1:])
+        semitones = [0, 2, 4, 5, 7, 9, 11][(number - 1) % 7] + 12 * ((number - 1) // 7)
+        if number % 7 in [1, 4, 5]:  # perfect intervals
+            semitones += {"P": 0, "A": 1, "d": -1}[quality]
+        else:
+            semitones += {"M": 0, "m": -1, "A": 1, "d": -2}[quality]
+
+        step_index = 7 * self.octave + STEPS.index(self.step) + direction * (number - 1)
+        step, octave = STEPS[step_index % 7], step_index // 7
+        alter = self.midi + direction * semitones - (12 * (octave + 1) + STEP_TO_SEMITONE[step])
+        return DisplayPitch(step, alter, octave)
+
+    def __str__(self):
+        """The name in music21's notation, e.g., 'B-3'."""
+        return f"{self.step}{'#' * self.alter if self.alter > 0 else '-' * -self.alter}{self.octave}"
+
+    def __repr__(self):
+        return f"DisplayPitch: {self.step}{ALTER_TO_ACCIDENTAL[self.alter] or ''}{self.octave}"
+
+
+def _create_transposition_table():
+    transpositions = [None] + [fingering.transposition_index for fingering in dataclasses.astuple(Fingering())]
+    pitches = [suzipu_to_info(symbol).basic_pitch for symbol in dataclasses.astuple(GongcheMelodySymbol())] + ["C4"]
+    table = {}
+    for pitch in pitches:
+        for transposition in transpositions:
+            transposed = DisplayPitch.from_string(pitch)
+            if transposition is not None:
+                transposed = transposed.transpose(transposition)
+            table[(pitch, transposition)] = transposed
+            table[(pitch, transposition, "P8")] = transposed.transpose("P8")
+    return table
+
+
+TRANSPOSITION_TABLE = _create_transposition_table()
+'''dict[(basic pitch, transposition of the fingering or None(, additional transposition))] -> DisplayPitch, for all
+gongche symbols and fingerings'''
+
+
+def transpose(pitch: str, *intervals):
+    """Returns the DisplayPitch of the pitch name transposed by the intervals (None meaning no transposition)."""
+    try:
+        return TRANSPOSITION_TABLE[(pitch,) + intervals]
+    except KeyError:
+        transposed = DisplayPitch.from_string(pitch)
+        for interval in intervals:
+            if interval is not None:
+                transposed = transposed.transpose(interval)
+        return transposed
+
+
+class DisplayNote:
+    """A note (or rest, if pitch is None) of the notation images. Only stores what the renderers draw."""
+    __slots__ = ("pitch", "basic_pitch", "original_pitch", "additional_symbol", "lyric", "line_break")
+
+    def __init__(self, basic_pitch, original_pitch, additional_symbol, lyric, line_break, transposition=(None,)):
+        self.basic_pitch = basic_pitch
+        '''The untransposed pitch name, e.g., 'F#4', or None for rests'''
+        self.pitch = transpose(basic_pitch, *transposition) if basic_pitch is not None else None
+        self.original_pitch = original_pitch
+        '''The notation symbol the pitch originates from'''
+        self.additional_symbol = additional_symbol
+        self.lyric = lyric
+        self.line_break = line_break
+
+    @property
+    def is_rest(self):
+        return self.pitch is None
+
+    def transposed(self, *intervals):
+        """Returns a copy of the note, transposed from its basic pitch by the intervals."""
+        return DisplayNote(self.basic_pitch, self.original_pitch, self.additional_symbol, self.lyric, self.line_break,
+                           intervals)
+
+
+def construct_display_notes(notation_list, lyrics_list, line_break_idxs):
+    """Counterpart of the music21 stream used for the MusicXML export, as a list of DisplayNote."""
+    notes = []
+    for box_idx, notation in enumerate(notation_list):
+        try:
+            pitch = notation["pitch"]
+        except (KeyError, TypeError):
+            pitch = None
+
+        try:
+            secondary = notation["secondary"]
+        except (KeyError, TypeError):
+            secondary = None
+
+        if not pitch:
+            notes.append(DisplayNote(None, None, None, lyrics_list[box_idx], box_idx in line_break_idxs))
+        else:
+            additional_symbol = secondary
+            if "is_zhezi" in notation and notation["is_zhezi"]:
+                additional_symbol = SuzipuAdditionalSymbol.ADD_ZHE  # Zhezi for lülüpu
+
+            notes.append(DisplayNote(suzipu_to_info(pitch).basic_pitch or "C4", pitch, additional_symbol,
+                                     lyrics_list[box_idx], box_idx in line_break_idxs))
+    return notes
+
+
+class AccidentalDisplay:
+    """Decides which accidentals are drawn, following music21's Pitch.updateAccidentalDisplay for a single measure
+    without key signature: a natural sign is added to an unaltered pitch if the last preceding pitch of the same step
+    (and octave), or the last preceding altered pitch of the same step in any octave, is altered differently."""
+    def __init__(self):
+        self.pitch_past = []
+        '''The preceding pitches as (step, octave, accidental)'''
+
+    def update(self, pitch: DisplayPitch):
+        """Returns the accidental to be drawn for pitch, which must be the next pitch of the piece."""
+        accidental = pitch.accidental
+        if accidental is None and self._needs_natural(pitch):
+            accidental = "natural"
+        self.pitch_past.append((pitch.step, pitch.octave, accidental))
+        return accidental
+
+    def _needs_natural(self, pitch):
+        for step, octave, accidental in reversed(self.pitch_past):
+            if step == pitch.step and octave == pitch.octave:
+                if accidental not in [None, "natural"]:
+                    return True
+                break
+        for step, octave, accidental in reversed(self.pitch_past):
+            if step == pitch.step and accidental is not None:
+                return accidental != "natural"
+        return False
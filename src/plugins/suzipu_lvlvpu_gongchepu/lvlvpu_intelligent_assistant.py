@@ -52,9 +52,7 @@ def load_transforms():
 
 
 def load_model():
-    pitch_model = TemperatureScalingCalibrationModule(CnnModel(num_classes=17))
-    pitch_model.load_state_dict(torch.load("./src/plugins/suzipu_lvlvpu_gongchepu/lvlv_model.std"))
-    pitch_model.eval()
+    pitch_model = load_cnn_model(17, "./src/plugins/suzipu_lvlvpu_gongchepu/lvlv_model.std")
 
     with open("./src/plugins/suzipu_lvlvpu_gongchepu/lvlv_umap_models.pkl", "rb") as file_handle:
         umap_models = pickle.load(file_handle)
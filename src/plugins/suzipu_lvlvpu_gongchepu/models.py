@@ -1,3 +1,5 @@
+import os
+
 import cv2
 import numpy as np
 from skimage.util import random_noise
@@ -9,6 +11,8 @@ from torch.utils.data import DataLoader
 import torchvision.transforms as transforms
 import random
 
+from src.config import USE_QUANTIZED_MODELS
+
 
 def shrink(is_random=True, target_size=20):
     def inner(input_image):
@@ -136,7 +140,12 @@ class CnnModel(nn.Module):
 
         self.logits = nn.LogSoftmax(dim=1)
 
+        # identity in the float model, they convert from and to int8 after quantization
+        self.quant = torch.ao.quantization.QuantStub()
+        self.dequant = torch.ao.quantization.DeQuantStub()
+
     def forward(self, x):
+        x = self.quant(x)
         x = F.relu(self.bn1(self.conv1(x)))
         x = self.pool(x)
         x = F.relu(self.bn2(self.conv2(x)))
@@ -148,10 +157,12 @@ class CnnModel(nn.Module):
         x = F.relu(self.fc1(x))
         x = self.dropout(x)
         x = self.fc2(x)
+        x = self.dequant(x)
         # x = self.logits(x)
         return x  # No softmax, as it's handled in CrossEntropyLoss
 
     def get_representation(self, x):
+        x = self.quant(x)
         x = F.relu(self.bn1(self.conv1(x)))
         x = self.pool(x)
         x = F.relu(self.bn2(self.conv2(x)))
@@ -161,6 +172,7 @@ class CnnModel(nn.Module):
 
         x = torch.flatten(x, start_dim=1)  # Flatten the feature maps
         x = self.fc1(x)
+        x = self.dequant(x)
         return x
 
 
@@ -217,3 +229,41 @@ class TemperatureScalingCalibrationModule(nn.Module):
         for parameter in self.model.parameters():
             parameter.requires_grad = False
         return self
+
+
+def get_quantized_weights_path(weights_path):
+    base_path, extension = os.path.splitext(weights_path)
+    return f"{base_path}.int8{extension}"
+
+
+def prepare_quantization(model: CnnModel):
+    model.eval()
+    model.qconfig = torch.ao.quantization.get_default_qconfig("x86")
+    torch.ao.quantization.fuse_modules(model, [["conv1", "bn1"], ["conv2", "bn2"], ["conv3", "bn3"]], inplace=True)
+    torch.ao.quantization.prepare(model, inplace=True)
+    return model
+
+
+def quantize_model(model: CnnModel, calibration_images):
+    """Post-training static int8 quantization of the conv and linear layers, in place. The activation ranges are
+    calibrated with calibration_images, a tensor of shape [N, 1, 48, 48] after the evaluation transforms."""
+    prepare_quantization(model)
+    with torch.no_grad():
+        model(calibration_images)
+    torch.ao.quantization.convert(model, inplace=True)
+    return model
+
+
+def load_cnn_model(num_classes, weights_path):
+    """Loads the classifier, using the quantized weights instead if they exist and USE_QUANTIZED_MODELS is set."""
+    model = TemperatureScalingCalibrationModule(CnnModel(num_classes=num_classes))
+
+    quantized_weights_path = get_quantized_weights_path(weights_path)
+    if USE_QUANTIZED_MODELS and os.path.isfile(quantized_weights_path):
+        # a dummy calibration pass builds the quantized skeleton; its scales are overwritten by the stored ones
+        quantize_model(model.model, torch.zeros(1, 1, 48, 48))
+        weights_path = quantized_weights_path
+
+    model.load_state_dict(torch.load(weights_path))
+    model.eval()
+    return model
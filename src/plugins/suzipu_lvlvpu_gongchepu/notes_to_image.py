@@ -1,29 +1,20 @@
+import collections
 import dataclasses
 import os
+import threading
 
 from PIL import Image, ImageChops, ImageDraw, ImageFont
-import music21
 import argparse
 import json
 
-from music21 import articulations
-
 from src.fingering import FingeringProperties, Fingering, fingering_to_lowest_note
 from src.plugins.suzipu_lvlvpu_gongchepu.common import GongcheMelodySymbol, GongdiaoModeList, SuzipuAdditionalSymbol, \
     suzipu_to_info
+from src.plugins.suzipu_lvlvpu_gongchepu.display_notes import DisplayPitch, AccidentalDisplay, construct_display_notes, \
+    transpose
 from src.config import JIANPU_IMAGE_PATH, FIVELINE_IMAGE_PATH, CHINESE_FONT_FILE, SUZIPU_NOTATION_IMAGE_PATH, \
     CHINESE_FONT_FALLBACK
 
-accidental_dictionary = {
-            "None": None,
-            "<music21.pitch.Accidental flat>": "flat",
-            "<music21.pitch.Accidental natural>": "natural",
-            "<music21.pitch.Accidental sharp>": "sharp",
-            "<music21.pitch.Accidental double-sharp>": "double_sharp",
-            "<music21.pitch.Accidental double-flat>": "double_flat",
-        }
-
-
 additional_symbol_dictionary = {
             None: "add_none",
             SuzipuAdditionalSymbol.ADD_DA_DUN: "add_dadun",
@@ -59,14 +50,8 @@ def load_suzipu_image_dict():
 
 
 def load_font(font_size):
-    from matplotlib import font_manager
-    font = font_manager.FontProperties(fname=CHINESE_FONT_FILE)
-    file = font_manager.findfont(font)
-    font = ImageFont.truetype(file, font_size)
-
-    fallback_font = font_manager.FontProperties(fname=CHINESE_FONT_FALLBACK)
-    fallback_file = font_manager.findfont(fallback_font)
-    fallback_font = ImageFont.truetype(fallback_file, font_size)
+    font = ImageFont.truetype(CHINESE_FONT_FILE, font_size)
+    fallback_font = ImageFont.truetype(CHINESE_FONT_FALLBACK, font_size)
     return [font, fallback_font]
 
 
@@ -81,15 +66,95 @@ def draw_with_fallback(text_draw, dimensions, text, fill, font):
     return
 
 
-class NotationResources:
-    def __init__(self):
-        self.smallest_font = load_font(25)
-        self.small_font = load_font(40)
-        self.title_font = load_font(70)
+def get_font_key(font):
+    return tuple((font_variant.path, font_variant.size) for font_variant in font)
+
+
+class NoteCellCache:
+    """Bounded LRU cache of rendered note cells. Most pieces use a small vocabulary of symbols and lyrics, so rendering
+    a whole piece mostly pastes cached cells. The key must contain everything the cell depends on, e.g., the renderer,
+    the symbols, the lyric, the font and the orientation. The cached cells are shared and must not be modified."""
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.cells = collections.OrderedDict()
+        '''OrderedDict[key] -> PIL image of the cell, least recently used first'''
+        self.lock = threading.Lock()
+
+    def get(self, key, render):
+        with self.lock:
+            cell = self.cells.get(key)
+            if cell is not None:
+                self.cells.move_to_end(key)
+                return cell
+        cell = render()
+        with self.lock:
+            self.cells[key] = cell
+            if len(self.cells) > self.max_entries:
+                self.cells.popitem(last=False)
+        return cell
 
-        self.jianpu_image_dict = load_jianpu_image_dict()
-        self.staff_image_dict = load_staff_image_dict()
-        self.suzipu_image_dict = load_suzipu_image_dict()
+    def clear(self):
+        with self.lock:
+            self.cells.clear()
+
+
+note_cell_cache = NoteCellCache()
+
+
+class NotationResources:
+    """Process-wide registry of the fonts and notation images, i.e., NotationResources() always returns the same
+    instance. Each font size is loaded and each image dictionary is decoded on first access, so importing the plugins
+    costs nothing and only the resources of the displayed notation types are ever loaded."""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._fonts = {}
+                '''dict[font size] -> [font, fallback font]'''
+                instance._image_dicts = {}
+                '''dict[loader function] -> image dictionary'''
+                instance._lock = threading.Lock()
+                cls._instance = instance
+        return cls._instance
+
+    def get_font(self, font_size):
+        with self._lock:
+            if font_size not in self._fonts:
+                self._fonts[font_size] = load_font(font_size)
+            return self._fonts[font_size]
+
+    def _get_image_dict(self, load_image_dict):
+        with self._lock:
+            if load_image_dict not in self._image_dicts:
+                self._image_dicts[load_image_dict] = load_image_dict()
+            return self._image_dicts[load_image_dict]
+
+    @property
+    def smallest_font(self):
+        return self.get_font(25)
+
+    @property
+    def small_font(self):
+        return self.get_font(40)
+
+    @property
+    def title_font(self):
+        return self.get_font(70)
+
+    @property
+    def jianpu_image_dict(self):
+        return self._get_image_dict(load_jianpu_image_dict)
+
+    @property
+    def staff_image_dict(self):
+        return self._get_image_dict(load_staff_image_dict)
+
+    @property
+    def suzipu_image_dict(self):
+        return self._get_image_dict(load_suzipu_image_dict)
 
 
 def parse_arguments():
@@ -157,58 +222,10 @@ def apply_border_to_boxes(boxes, border_width, border_heigth):
     return new_boxes
 
 
-def construct_note_stream(notation_list, lyrics_list, line_break_idxs):
-    stream = music21.stream.Stream()
-
-    current_measure = music21.stream.Measure()
-    for box_idx, notation in enumerate(notation_list):
-
-        try:
-            pitch = notation["pitch"]
-        except (KeyError, TypeError):
-            pitch = None
-
-        try:
-            secondary = notation["secondary"]
-        except (KeyError, TypeError):
-            secondary = None
-
-        if not pitch:
-            note = music21.note.Rest()
-            note.lyric = lyrics_list[box_idx]
-
-            note.additional_symbol = None
-            note.line_break = False
-            note.original_pitch = None
-
-            if box_idx in line_break_idxs:
-                note.line_break = True
-
-            current_measure.append([note])
-        else:
-            original_pitch = pitch
-            pitch = suzipu_to_info(pitch).basic_pitch
-
-            note = music21.note.Note(pitch, type="16th")
-            note.lyric = lyrics_list[box_idx]
-
-            note.line_break = False
-            if box_idx in line_break_idxs:
-                note.line_break = True
-
-            note.additional_symbol = secondary
-            note.original_pitch = original_pitch
-
-            if "is_zhezi" in notation and notation["is_zhezi"]:
-                note.additional_symbol = SuzipuAdditionalSymbol.ADD_ZHE  # Zhezi for lülüpu
-
-            current_measure.append([note])
-    stream.append(current_measure)
-
-    return stream
-
-
 def construct_note_stream_musicxml(suzipu_list, lyrics_list):
+    import music21
+    from music21 import articulations
+
     stream = music21.stream.Stream()
 
     current_measure = music21.stream.Measure()
@@ -309,17 +326,16 @@ def construct_note_stream_musicxml(suzipu_list, lyrics_list):
     return stream
 
 
-def determine_image_width(stream):
+def determine_image_width(notes):
     max_counter = -1
 
     counter = 0
-    for measure in stream:
-        for idx, note in enumerate(measure):
-            if note.line_break or idx == len(measure)-1:
-                max_counter = max(counter+1, max_counter)
-                counter = 0
-            else:
-                counter += 1
+    for idx, note in enumerate(notes):
+        if note.line_break or idx == len(notes)-1:
+            max_counter = max(counter+1, max_counter)
+            counter = 0
+        else:
+            counter += 1
 
     return max_counter
 
@@ -339,6 +355,8 @@ def determine_image_width_manual(lyric_list, line_break_idxs):
 
 
 def parse_notation_and_write_to_file(suzipu_list, lyrics_list, output_file_path_str: str):
+    import music21
+
     stream = music21.stream.Stream()
 
     measures = []
@@ -379,7 +397,7 @@ def parse_notation_and_write_to_file(suzipu_list, lyrics_list, output_file_path_
 
 
 def common_notation_to_jianpu(font, image_dict, mode, music_list, lyrics_list, line_break_idxs=[], fingering=Fingering.ALL_CLOSED_AS_1, return_boxes=False):
-    pitch_past = []
+    accidental_display = AccidentalDisplay()
 
     width = 65
 
@@ -415,39 +433,43 @@ def common_notation_to_jianpu(font, image_dict, mode, music_list, lyrics_list, l
             OctaveIdentifier.DOUBLE_HIGH: "double_high",
         }
 
-        whole_img = Image.new('RGB', (width, width * 3), (255, 255, 255))
-        pitch_img = Image.new('RGB', (width, width), (255, 255, 255))
         lyric = note.lyric
+        symbols = None
 
-        if note.isRest:
+        if note.is_rest:
             pass
         else:
             additional_symbol = additional_symbol_dictionary[note.additional_symbol]
             pitch_idx = pitch_dictionary[note.pitch.step]
             octave = octave_dictionary[note.pitch.octave]
 
-            note.pitch.updateAccidentalDisplay(pitchPast=pitch_past)
-            pitch_past.append(note.pitch)
+            accidental = accidental_display.update(note.pitch)
+            symbols = (additional_symbol, pitch_idx, octave, accidental)
 
-            accidental = accidental_dictionary[repr(note.pitch.accidental)]
+        def render():
+            whole_img = Image.new('RGB', (width, width * 3), (255, 255, 255))
+            pitch_img = Image.new('RGB', (width, width), (255, 255, 255))
 
-            pitch_img = ImageChops.multiply(pitch_img, image_dict[pitch_idx])
-            if octave is not None:
-                pitch_img = ImageChops.multiply(pitch_img, image_dict[octave])
-            if accidental is not None:
-                pitch_img = ImageChops.multiply(pitch_img, image_dict[accidental])
+            if symbols is not None:
+                pitch_img = ImageChops.multiply(pitch_img, image_dict[pitch_idx])
+                if octave is not None:
+                    pitch_img = ImageChops.multiply(pitch_img, image_dict[octave])
+                if accidental is not None:
+                    pitch_img = ImageChops.multiply(pitch_img, image_dict[accidental])
 
-            whole_img.paste(image_dict[additional_symbol], (0, 0))
-            whole_img.paste(pitch_img, (0, width))
+                whole_img.paste(image_dict[additional_symbol], (0, 0))
+                whole_img.paste(pitch_img, (0, width))
 
-        if lyric is not None:
-            text_draw = ImageDraw.Draw(whole_img)
-            draw_with_fallback(text_draw, (10, width*2), lyric, fill=(0, 0, 0), font=font)
+            if lyric is not None:
+                text_draw = ImageDraw.Draw(whole_img)
+                draw_with_fallback(text_draw, (10, width*2), lyric, fill=(0, 0, 0), font=font)
 
-        return whole_img
+            return whole_img
+
+        return note_cell_cache.get(("jianpu", symbols, lyric, get_font_key(font)), render)
 
-    def construct_notation_image(stream, image_dict) -> tuple:
-        image_width = determine_image_width(stream)
+    def construct_notation_image(notes, image_dict) -> tuple:
+        image_width = determine_image_width(notes)
         image_height = len(line_break_idxs)+1
 
         current_row_counter = 0
@@ -459,24 +481,23 @@ def common_notation_to_jianpu(font, image_dict, mode, music_list, lyrics_list, l
 
         whole_image = Image.new('RGB', (width * image_width, image_height * width * 4), (255, 255, 255))
 
-        for measure in stream:
-            idx = 0
-            for note in measure:
-                current_img = note_to_suzipu(font, note, image_dict)
-                whole_image.paste(current_img, (width * idx, current_row_counter * width * 4))
-                boxes.append(((width * idx, current_row_counter * width * 4), (width + width * idx, current_row_counter * width * 4 + 3 * width)))
-                if note.line_break:
-                    current_row_counter += 1
-                    idx = 0
-                else:
-                    idx += 1
+        idx = 0
+        for note in notes:
+            current_img = note_to_suzipu(font, note, image_dict)
+            whole_image.paste(current_img, (width * idx, current_row_counter * width * 4))
+            boxes.append(((width * idx, current_row_counter * width * 4), (width + width * idx, current_row_counter * width * 4 + 3 * width)))
+            if note.line_break:
+                current_row_counter += 1
+                idx = 0
+            else:
+                idx += 1
         return whole_image, boxes
 
-    stream = construct_note_stream(music_list, lyrics_list, line_break_idxs)
-    stream = stream.transpose(fingering.transposition_index)
+    notes = [note.transposed(fingering.transposition_index)
+             for note in construct_display_notes(music_list, lyrics_list, line_break_idxs)]
 
     fingering_img = construct_fingering_image(font, image_dict, fingering)
-    notation_image, boxes = construct_notation_image(stream, image_dict)
+    notation_image, boxes = construct_notation_image(notes, image_dict)
 
     whole_image = vertical_composition([fingering_img, notation_image])
 
@@ -488,7 +509,7 @@ def common_notation_to_jianpu(font, image_dict, mode, music_list, lyrics_list, l
 
 
 def common_notation_to_staff(font, image_dict, mode, music_list, lyrics_list, line_break_idxs=[], fingering=Fingering.ALL_CLOSED_AS_1, return_boxes=False):
-    pitch_past = []
+    accidental_display = AccidentalDisplay()
     width = 65
 
     if mode:
@@ -539,69 +560,72 @@ def common_notation_to_staff(font, image_dict, mode, music_list, lyrics_list, li
             else:
                 throw_error()
 
-        whole_img = Image.new('RGB', (width, width + 120 + width), (255, 255, 255))
-        notation_img = Image.new('RGB', (width, 120), (255, 255, 255))
-        notehead_img = Image.new('RGB', (width, 30), (255, 255, 255))
         lyric = note.lyric
+        symbols = None
 
-        if note.isRest:
+        if note.is_rest:
             pass
         else:
-            note.pitch.updateAccidentalDisplay(pitchPast=pitch_past)
-            pitch_past.append(note.pitch)
-
+            accidental = accidental_display.update(note.pitch)
             additional_symbol = additional_symbol_dictionary[note.additional_symbol]
-            accidental = accidental_dictionary[repr(note.pitch.accidental)]
 
             offset, staff_type = note_to_offset_and_staff_type(note)
+            symbols = (additional_symbol, accidental, offset, staff_type)
 
-            notehead_img = ImageChops.multiply(notehead_img, image_dict["notehead"])
-            if accidental is not None:
-                notehead_img = ImageChops.multiply(notehead_img, image_dict[accidental])
+        def render():
+            whole_img = Image.new('RGB', (width, width + 120 + width), (255, 255, 255))
+            notation_img = Image.new('RGB', (width, 120), (255, 255, 255))
+            notehead_img = Image.new('RGB', (width, 30), (255, 255, 255))
 
-            notation_img.paste(notehead_img, (0, offset))
-            notation_img = ImageChops.multiply(notation_img, image_dict[staff_type])
+            if symbols is not None:
+                notehead_img = ImageChops.multiply(notehead_img, image_dict["notehead"])
+                if accidental is not None:
+                    notehead_img = ImageChops.multiply(notehead_img, image_dict[accidental])
 
-            whole_img.paste(image_dict[additional_symbol], (0, 0))
-            whole_img.paste(notation_img, (0, width))
+                notation_img.paste(notehead_img, (0, offset))
+                notation_img = ImageChops.multiply(notation_img, image_dict[staff_type])
 
-        if lyric is not None:
-            text_draw = ImageDraw.Draw(whole_img)
-            draw_with_fallback(text_draw, (10, width + 120), lyric, fill=(0, 0, 0), font=font)
+                whole_img.paste(image_dict[additional_symbol], (0, 0))
+                whole_img.paste(notation_img, (0, width))
 
-        return whole_img
+            if lyric is not None:
+                text_draw = ImageDraw.Draw(whole_img)
+                draw_with_fallback(text_draw, (10, width + 120), lyric, fill=(0, 0, 0), font=font)
 
-    def construct_notation_image(stream, image_dict):
-        image_width = determine_image_width(stream) + 1
+            return whole_img
+
+        return note_cell_cache.get(("staff", symbols, lyric, get_font_key(font)), render)
+
+    def construct_notation_image(notes, image_dict):
+        image_width = determine_image_width(notes) + 1
         image_height = len(line_break_idxs)+1
 
         boxes = []
 
         current_row_counter = 0
         whole_image = Image.new('RGB', (width * image_width, image_height * (width + 120 + width + width)), (255, 255, 255))
-        for measure in stream:
-            idx = 0
-            for note in measure:
-                current_img = note_to_staff(font, note, image_dict)
-                whole_image.paste(current_img, (width * (idx + 1), current_row_counter * (width + 120 + width + width)))
-                boxes.append(((width * (idx + 1), current_row_counter * (width + 120 + width + width)), (width * (idx + 2), (current_row_counter + 1) * (width + 120 + width + width) - width)))
-                if note.line_break:
-                    whole_image.paste(image_dict["clef"], (0, current_row_counter * (width + 120 + width + width) + width))
-                    current_row_counter += 1
-                    idx = 0
-                else:
-                    idx += 1
-            whole_image.paste(image_dict["clef"], (0, current_row_counter * (width + 120 + width + width) + width))
+        idx = 0
+        for note in notes:
+            current_img = note_to_staff(font, note, image_dict)
+            whole_image.paste(current_img, (width * (idx + 1), current_row_counter * (width + 120 + width + width)))
+            boxes.append(((width * (idx + 1), current_row_counter * (width + 120 + width + width)), (width * (idx + 2), (current_row_counter + 1) * (width + 120 + width + width) - width)))
+            if note.line_break:
+                whole_image.paste(image_dict["clef"], (0, current_row_counter * (width + 120 + width + width) + width))
+                current_row_counter += 1
+                idx = 0
+            else:
+                idx += 1
+        whole_image.paste(image_dict["clef"], (0, current_row_counter * (width + 120 + width + width) + width))
         return whole_image, boxes
 
-    stream = construct_note_stream(music_list, lyrics_list, line_break_idxs)
-    stream = stream.transpose(fingering.transposition_index)
-
-    if fingering_to_lowest_note(fingering) < music21.note.Note("Ab3"):
-        stream = stream.transpose("P8")  # transpose too deep into normal range
+    transposition = [fingering.transposition_index]
+    if transpose("C4", fingering.transposition_index).midi < DisplayPitch.from_string("Ab3").midi:
+        transposition.append("P8")  # transpose too deep into normal range
+    notes = [note.transposed(*transposition)
+             for note in construct_display_notes(music_list, lyrics_list, line_break_idxs)]
 
     fingering_img = construct_transposition_image(font, image_dict, fingering)
-    notation_image, boxes = construct_notation_image(stream, image_dict)
+    notation_image, boxes = construct_notation_image(notes, image_dict)
 
     boxes = apply_border_to_boxes(boxes, 0, fingering_img.height)
 
@@ -621,25 +645,32 @@ def _notation_to_textbased(font, notation_font, music_list, lyrics_list, note_to
         return box[0], box[1]
 
     def note_to_textbased(font, note):
+        lyric = note.lyric
+        notation = None
+
+        if not note.is_rest:
+            notation = note_to_textbased_function(note.original_pitch)
+            if note.additional_symbol == SuzipuAdditionalSymbol.ADD_ZHE:  # lvlvpu ZHE_ZI
+                notation = "字折"
+
+            if not is_vertical and len(notation) > 1:
+                notation = notation[::-1]
+
+        return note_cell_cache.get(("textbased", notation, lyric, get_font_key(font), get_font_key(notation_font),
+                                    is_vertical), lambda: render_cell(font, notation, lyric))
+
+    def render_cell(font, notation, lyric):
         whole_img = Image.new('RGB', switch_coordinates((width, 2 * width)), (255, 255, 255))
 
-        lyric = note.lyric
         text_draw = ImageDraw.Draw(whole_img)
 
-        if note.isRest:
+        if notation is None:
             if lyric is not None:
                 if is_vertical:
                     draw_with_fallback(text_draw, (15, 0), lyric, fill=(0, 0, 0), font=font)
                 else:
                     draw_with_fallback(text_draw, (10, width), lyric, fill=(0, 0, 0), font=font)
         else:
-            notation = note_to_textbased_function(note.original_pitch)
-            if note.additional_symbol == SuzipuAdditionalSymbol.ADD_ZHE:  # lvlvpu ZHE_ZI
-                notation = "字折"
-
-            if not is_vertical and len(notation) > 1:
-                notation = notation[::-1]
-
             if is_vertical:
                 if len(notation) == 1:
                     draw_with_fallback(text_draw, (85, 15), notation[0], fill=(0, 0, 0), font=notation_font)
@@ -659,8 +690,8 @@ def _notation_to_textbased(font, notation_font, music_list, lyrics_list, note_to
 
         return whole_img
 
-    def construct_notation_image(stream) -> tuple:
-        image_width = determine_image_width(stream)
+    def construct_notation_image(notes) -> tuple:
+        image_width = determine_image_width(notes)
         image_height = len(line_break_idxs) + 1
 
         current_row_counter = 0
@@ -674,29 +705,28 @@ def _notation_to_textbased(font, notation_font, music_list, lyrics_list, note_to
         whole_image_height = image_height * width * 3
         whole_image = Image.new('RGB', switch_coordinates((whole_image_width, whole_image_height)), (255, 255, 255))
 
-        for measure in stream:
-            idx = 0
-            for note in measure:
-                if is_vertical:
-                    current_img = note_to_textbased(font, note)
-                    whole_image.paste(current_img, switch_coordinates((width * idx, whole_image_height - 3*width - current_row_counter * width * 3)))
-                    boxes.append((switch_coordinates((width * idx, whole_image_height - 3*width - current_row_counter * width * 3)),
-                                  switch_coordinates((width + width * idx, whole_image_height - 3*width - current_row_counter * width * 3 + 2 * width))))
-                else:
-                    current_img = note_to_textbased(font, note)
-                    whole_image.paste(current_img, switch_coordinates((width * idx, current_row_counter * width * 3)))
-                    boxes.append((switch_coordinates((width * idx, current_row_counter * width * 3)),
-                                  switch_coordinates((width + width * idx, current_row_counter * width * 3 + 2 * width))))
-                if note.line_break:
-                    current_row_counter += 1
-                    idx = 0
-                else:
-                    idx += 1
+        idx = 0
+        for note in notes:
+            if is_vertical:
+                current_img = note_to_textbased(font, note)
+                whole_image.paste(current_img, switch_coordinates((width * idx, whole_image_height - 3*width - current_row_counter * width * 3)))
+                boxes.append((switch_coordinates((width * idx, whole_image_height - 3*width - current_row_counter * width * 3)),
+                              switch_coordinates((width + width * idx, whole_image_height - 3*width - current_row_counter * width * 3 + 2 * width))))
+            else:
+                current_img = note_to_textbased(font, note)
+                whole_image.paste(current_img, switch_coordinates((width * idx, current_row_counter * width * 3)))
+                boxes.append((switch_coordinates((width * idx, current_row_counter * width * 3)),
+                              switch_coordinates((width + width * idx, current_row_counter * width * 3 + 2 * width))))
+            if note.line_break:
+                current_row_counter += 1
+                idx = 0
+            else:
+                idx += 1
         return whole_image, boxes
 
-    stream = construct_note_stream(music_list, lyrics_list, line_break_idxs)
+    notes = construct_display_notes(music_list, lyrics_list, line_break_idxs)
 
-    notation_image, boxes = construct_notation_image(stream)
+    notation_image, boxes = construct_notation_image(notes)
 
     if return_boxes:
         return notation_image, boxes
@@ -800,12 +830,10 @@ def notation_to_suzipu(font, image_dict, music_list, lyrics_list, line_break_idx
         return box[0], box[1]
 
     def note_to_suzipu(font, note):
-        whole_img = Image.new('RGB', switch_coordinates((width, 2 * width)), (255, 255, 255))
-        whole_img_copy = Image.new('RGB', switch_coordinates((width, 2 * width)), (255, 255, 255))
-
         lyric = note.lyric
+        symbols = None
 
-        if note.isRest:
+        if note.is_rest:
             pass
         else:
             original_pitch = None
@@ -821,7 +849,17 @@ def notation_to_suzipu(font, image_dict, music_list, lyrics_list, line_break_idx
                     additional_symbol = suzipu_to_info(note.additional_symbol).name.lower()
                 except AttributeError:
                     pass
+            symbols = (original_pitch, additional_symbol)
 
+        return note_cell_cache.get(("suzipu", symbols, lyric, get_font_key(font), is_vertical),
+                                   lambda: render_cell(font, symbols, lyric))
+
+    def render_cell(font, symbols, lyric):
+        whole_img = Image.new('RGB', switch_coordinates((width, 2 * width)), (255, 255, 255))
+        whole_img_copy = Image.new('RGB', switch_coordinates((width, 2 * width)), (255, 255, 255))
+
+        if symbols is not None:
+            original_pitch, additional_symbol = symbols
             if is_vertical:
                 if original_pitch is not None and additional_symbol is not None:
                     whole_img.paste(image_dict[original_pitch], (80, 7))
@@ -848,8 +886,8 @@ def notation_to_suzipu(font, image_dict, music_list, lyrics_list, line_break_idx
 
         return whole_img
 
-    def construct_notation_image(stream) -> tuple:
-        image_width = determine_image_width(stream)
+    def construct_notation_image(notes) -> tuple:
+        image_width = determine_image_width(notes)
         image_height = len(line_break_idxs) + 1
 
         current_row_counter = 0
@@ -863,30 +901,29 @@ def notation_to_suzipu(font, image_dict, music_list, lyrics_list, line_break_idx
         whole_image_height = image_height * width * 3
         whole_image = Image.new('RGB', switch_coordinates((whole_image_width, whole_image_height)), (255, 255, 255))
 
-        for measure in stream:
-            idx = 0
-            for note in measure:
-                if is_vertical:
-                    current_img = note_to_suzipu(font, note)
-                    whole_image.paste(current_img, switch_coordinates((width * idx, whole_image_height - width * 3 - current_row_counter * width * 3)))
-                    boxes.append((switch_coordinates((width * idx, whole_image_height - width * 3 - current_row_counter * width * 3)),
-                                  switch_coordinates((width + width * idx, whole_image_height - width * 3 - current_row_counter * width * 3 + 2 * width))))
-                else:
-                    current_img = note_to_suzipu(font, note)
-                    whole_image.paste(current_img, switch_coordinates((width * idx, current_row_counter * width * 3)))
-                    boxes.append((switch_coordinates((width * idx, current_row_counter * width * 3)),
-                                  switch_coordinates(
-                                      (width + width * idx, current_row_counter * width * 3 + 2 * width))))
-                if note.line_break:
-                    current_row_counter += 1
-                    idx = 0
-                else:
-                    idx += 1
+        idx = 0
+        for note in notes:
+            if is_vertical:
+                current_img = note_to_suzipu(font, note)
+                whole_image.paste(current_img, switch_coordinates((width * idx, whole_image_height - width * 3 - current_row_counter * width * 3)))
+                boxes.append((switch_coordinates((width * idx, whole_image_height - width * 3 - current_row_counter * width * 3)),
+                              switch_coordinates((width + width * idx, whole_image_height - width * 3 - current_row_counter * width * 3 + 2 * width))))
+            else:
+                current_img = note_to_suzipu(font, note)
+                whole_image.paste(current_img, switch_coordinates((width * idx, current_row_counter * width * 3)))
+                boxes.append((switch_coordinates((width * idx, current_row_counter * width * 3)),
+                              switch_coordinates(
+                                  (width + width * idx, current_row_counter * width * 3 + 2 * width))))
+            if note.line_break:
+                current_row_counter += 1
+                idx = 0
+            else:
+                idx += 1
         return whole_image, boxes
 
-    stream = construct_note_stream(music_list, lyrics_list, line_break_idxs)
+    notes = construct_display_notes(music_list, lyrics_list, line_break_idxs)
 
-    notation_image, boxes = construct_notation_image(stream)
+    notation_image, boxes = construct_notation_image(notes)
 
     if return_boxes:
         return notation_image, boxes
@@ -894,6 +931,8 @@ def notation_to_suzipu(font, image_dict, music_list, lyrics_list, line_break_idx
 
 
 def write_to_musicxml(file_path, suzipu_list, lyrics_list, fingering=Fingering.ALL_CLOSED_AS_1, title="", mode="", preface=""):
+    import music21
+
     stream = construct_note_stream_musicxml(suzipu_list, lyrics_list)
     stream = stream.transpose(fingering.transposition_index)
 
@@ -1060,7 +1099,7 @@ def construct_transposition_image(font, image_dict, fingering):
     he_mark = he_mark.resize((50, 50))
 
     whole_image.paste(he_mark, (40, 20))
-    draw_with_fallback(text_draw, (0, 15), f"（       =  {fingering_to_lowest_note(fingering).pitch}）", fill=(0, 0, 0), font=font)
+    draw_with_fallback(text_draw, (0, 15), f"（       =  {transpose('C4', fingering.transposition_index)}）", fill=(0, 0, 0), font=font)
 
     return whole_image
 
@@ -45,13 +45,8 @@ def load_transforms():
 
 
 def load_model():
-    pitch_model = TemperatureScalingCalibrationModule(CnnModel(num_classes=11))
-    pitch_model.load_state_dict(torch.load("./src/plugins/suzipu_lvlvpu_gongchepu/suzi_model_pitch.std"))
-    secondary_model = TemperatureScalingCalibrationModule(CnnModel(num_classes=7))
-    secondary_model.load_state_dict(torch.load("./src/plugins/suzipu_lvlvpu_gongchepu/suzi_model_secondary.std"))
-
-    pitch_model.eval()
-    secondary_model.eval()
+    pitch_model = load_cnn_model(11, "./src/plugins/suzipu_lvlvpu_gongchepu/suzi_model_pitch.std")
+    secondary_model = load_cnn_model(7, "./src/plugins/suzipu_lvlvpu_gongchepu/suzi_model_secondary.std")
 
     with open("./src/plugins/suzipu_lvlvpu_gongchepu/suzi_umap_models.pkl", "rb") as file_handle:
         umap_models = pickle.load(file_handle)
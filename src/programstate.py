@@ -1,14 +1,18 @@
+import concurrent.futures
 import dataclasses
 import os
 import tkinter as tk
+import tkinter.ttk
+from tkinter.messagebox import askyesno
 
 import PIL
 import cv2
 from PIL import ImageTk
 
 from src.auxiliary import BoxType, JsonSerializable, SetInt, BoxesWithType, ListCycle, BoxManipulationAction, \
-    get_folder_contents, get_image_from_box_ai_assistant, get_image_from_box
-from src.hr_segmentation_adapter import predict_boxes
+    get_folder_contents, get_image_from_box_ai_assistant, get_image_from_box, pad_images_to_same_size, \
+    page_image_cache, PageStrip, BoxThumbnailCache
+from src.hr_segmentation_adapter import segmentation_engine, SegmentationTask, no_progress, raise_if_cancelled
 from src.plugins.suzipu_lvlvpu_gongchepu.notes_to_image import NotationResources
 from src.plugins import NotationTypePlugins
 
@@ -102,10 +106,95 @@ class PieceProperties(JsonSerializable):
         return dictionary
 
 
+def load_page_images(image_names, reverse):
+    images = [page_image_cache.get(image_name) for image_name in image_names]  # shared, must not be modified
+    if reverse:
+        images.reverse()
+    return images
+
+
+class PageImagePrefetcher:
+    """Decodes pages into the page image cache on a thread pool (cv2.imread releases the GIL), so that they are
+    already decoded when the user turns the page."""
+    def __init__(self, cache, max_workers=2):
+        self.cache = cache
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                              thread_name_prefix="page_prefetch")
+        self.futures = {}
+        '''dict[image path] -> Future of the decoding of this page'''
+
+    def prefetch(self, image_names):
+        image_names = [image_name for image_name in dict.fromkeys(image_names) if image_name not in self.cache]
+        for image_name, future in list(self.futures.items()):
+            if future.done() or image_name not in image_names:
+                future.cancel()  # only cancels the pages whose decoding has not started yet
+                del self.futures[image_name]
+        for image_name in image_names:
+            if image_name not in self.futures:
+                self.futures[image_name] = self.executor.submit(self._load, image_name)
+
+    def _load(self, image_name):
+        try:
+            self.cache.get(image_name)
+        except Exception:
+            pass  # the page is loaded again when it is displayed, which reports the error
+
+    def cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+
+
+def segment_page_images(engine, images, weights_path, tiled, individual_pages, on_progress=no_progress,
+                        cancel_event=None):
+    images = pad_images_to_same_size(images)
+    if tiled:  # the tiled mode never needs the merged image
+        return engine.predict_pages(images, weights_path, tiled=True, on_progress=on_progress,
+                                    cancel_event=cancel_event)
+    elif individual_pages:
+        return engine.predict_pages(images, weights_path, on_progress=on_progress, cancel_event=cancel_event)
+    else:
+        return engine.predict_boxes(cv2.hconcat(images), weights_path, on_progress=on_progress, cancel_event=cancel_event)
+
+
+class SegmentationPrefetcher:
+    """Segments pages in the background before they are displayed, so that their segmentation is a cache lookup
+    once the user presses 'Auto-Segmentation'."""
+    def __init__(self, engine):
+        self.engine = engine
+        self.task = None
+        self.task_arguments = None
+
+    def prefetch(self, image_names, reverse, weights_path, tiled, individual_pages):
+        if self.engine.cache is None:  # without cache, the results could not be reused
+            return
+
+        task_arguments = (tuple(image_names), reverse, weights_path, tiled, individual_pages)
+        if self.task is not None and task_arguments == self.task_arguments and not self.task.is_cancelled():
+            return  # the same pages are already prefetched
+        self.cancel()
+
+        self.task_arguments = task_arguments
+        self.task = SegmentationTask(self._segment, list(image_names), reverse, weights_path, tiled, individual_pages)
+        self.task.start()
+
+    def _segment(self, image_names, reverse, weights_path, tiled, individual_pages, on_progress, cancel_event):
+        images = load_page_images(image_names, reverse)
+        raise_if_cancelled(cancel_event)
+        return segment_page_images(self.engine, images, weights_path, tiled, individual_pages,
+                                   on_progress=on_progress, cancel_event=cancel_event)
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+
 class GuiState:
     def __init__(self, main_window, weights_path):
         self.main_window = main_window
         self.segmentation_weights_path = weights_path  # weights path for segmentation algorithm
+        self.segmentation_engine = segmentation_engine
+        '''Keeps the segmentation model loaded between segmentations'''
 
         self.images_dir = "./res/annotation_start_directory"
         '''Directory in which the images for the project are'''
@@ -116,8 +205,8 @@ class GuiState:
         self.empty_image = ImageTk.PhotoImage(image=PIL.Image.new("RGB", (80, 80), (255, 255, 255)))
         '''Empty annotation image'''
 
-        self.current_image = None
-        '''Currently displayed image'''
+        self.current_image: PageStrip = None
+        '''Currently displayed pages, which are never concatenated into a single image'''
         self.current_annotation_image = None
         '''Image belonging to currently selected box'''
         self.current_box_annotation = ""
@@ -135,19 +224,26 @@ class GuiState:
         self.number_of_pages = SetInt(1)
         self.draw_box_width = SetInt(1)
         '''the number of image files the piece uses'''
-        self.box_idx_to_tkinter_image_dict = {}
-        '''dict[global box idx] -> the tkinter image corresponding to this box'''
+        self.box_thumbnail_cache = BoxThumbnailCache()
+        '''The tkinter images of the boxes, created when a box becomes the current one'''
 
         # TK variables for dynamic information easily accessible by the widgets
         self.tk_display_images_in_reversed_order = tk.BooleanVar(self.main_window, True)
         '''If true, the pages are displayed in traditional Chinese order, i.e., from right to left'''
         self.tk_segmentation_individual_pages = tk.BooleanVar(self.main_window, True)
         '''If true, the individual pages are segmented individually instead of segmenting the merged image'''
+        self.tk_segmentation_tiled = tk.BooleanVar(self.main_window, False)
+        '''If true, the pages are segmented at native resolution in overlapping tiles instead of being resized'''
+        self.tk_segmentation_prefetch = tk.BooleanVar(self.main_window, False)
+        '''If true, the pages following the current piece are segmented in the background'''
         self.tk_current_filename = tk.StringVar(self.main_window)
         '''Currently selected image file name'''
 
         self.tk_current_action = tk.StringVar(self.main_window, BoxManipulationAction.NO_ACTION)
         '''The currently selected box manipulation action'''
+        self.tk_is_segmenting = tk.BooleanVar(self.main_window, False)
+        '''True while the current piece is segmented in the background, the boxes cannot be manipulated meanwhile since
+        they are replaced by the result'''
 
         self.tk_current_composer = tk.StringVar(self.main_window, "")
         '''The name of currently selected composer'''
@@ -173,6 +269,12 @@ class ProgramState:
     def __init__(self, piece_properties: PieceProperties, gui_state: GuiState):
         self.piece_properties = piece_properties
         self.gui_state = gui_state
+        self.segmentation_task = None
+        '''The SegmentationTask running in the background, if any'''
+        self.segmentation_prefetcher = SegmentationPrefetcher(self.gui_state.segmentation_engine)
+        '''Segments the next pages in the background, if prefetching is enabled'''
+        self.page_image_prefetcher = PageImagePrefetcher(page_image_cache)
+        '''Decodes the pages next to the displayed ones in the background'''
         self.initialize_from_piece_properties(self.piece_properties)
 
     def initialize_from_piece_properties(self, piece_properties):
@@ -190,6 +292,21 @@ class ProgramState:
     def get_first_page_image_name(self):
         return os.path.basename(self.gui_state.image_name_circle.get_current())
 
+    def get_box_thumbnail(self, idx):
+        return self.gui_state.box_thumbnail_cache.get(self.gui_state.current_image,
+                                                      self.piece_properties.content.get_index_coordinates(idx))
+
+    def prefetch_neighbouring_box_thumbnails(self, n=2):
+        # the boxes which become current after pressing 'Next' or 'Previous' up to n times
+        try:
+            type_cycle = self.get_current_type_cycle()
+            if not len(type_cycle):
+                return
+            for offset in list(range(1, n + 1)) + list(range(-1, -n - 1, -1)):
+                self.get_box_thumbnail(type_cycle.get_nth_from_current(offset))
+        except Exception:
+            pass  # the thumbnails are created when the boxes are displayed
+
     def get_current_annotation_index(self):
         try:
             if self.gui_state.tk_current_action.get() == BoxManipulationAction.ANNOTATE:
@@ -221,7 +338,8 @@ class ProgramState:
         if current_idx is not None:
             try:
                 if len(self.get_current_type_cycle()):
-                    self.gui_state.current_annotation_image = self.gui_state.box_idx_to_tkinter_image_dict[current_idx]
+                    self.gui_state.current_annotation_image = self.get_box_thumbnail(current_idx)
+                    self.gui_state.main_window.after_idle(self.prefetch_neighbouring_box_thumbnails)
                     self.gui_state.tk_current_box_out_of_current_type.set(
                         f"{self.get_current_type_cycle().current_position + 1} / {len(self.get_current_type_cycle())}")
                     self.gui_state.tk_num_all_boxes_of_current_type.set(
@@ -285,68 +403,99 @@ class ProgramState:
         self.gui_state.images = []
 
         if self.gui_state.number_of_pages.get() > 0:
-            for idx in range(0, self.gui_state.number_of_pages.get()):
-                image_name = self.gui_state.image_name_circle.get_nth_from_current(idx)
-                self.gui_state.images.append(cv2.cvtColor(cv2.imread(image_name), cv2.COLOR_BGR2RGB))
-
-            max_width, max_height = 0, 0
-            for image in self.gui_state.images:
-                max_height = max(image.shape[0], max_height)
-                max_width = max(image.shape[1], max_width)
-
-            for idx in range(len(self.gui_state.images)):
-                self.gui_state.images[idx] = cv2.copyMakeBorder(
-                    src=self.gui_state.images[idx],
-                    top=0,
-                    bottom=max_height - self.gui_state.images[idx].shape[0],
-                    left=0,
-                    right=max_width - self.gui_state.images[idx].shape[1],
-                    borderType=cv2.BORDER_CONSTANT,
-                    value=[255, 255, 255]
-                )
-
-            if self.gui_state.tk_display_images_in_reversed_order.get():
-                self.gui_state.images.reverse()
-
-            self.gui_state.current_image = cv2.hconcat(self.gui_state.images)
+            image_names = [self.gui_state.image_name_circle.get_nth_from_current(idx)
+                           for idx in range(0, self.gui_state.number_of_pages.get())]
+            self.gui_state.images = load_page_images(image_names,
+                                                     self.gui_state.tk_display_images_in_reversed_order.get())
+
+            self.gui_state.current_image = PageStrip(self.gui_state.images)
             self.gui_state.tk_current_filename.set(self.get_first_page_image_name())
             self.gui_state.must_be_changed = False
 
+            self.prefetch_neighbouring_page_images()
+            if self.gui_state.tk_segmentation_prefetch.get():
+                self.prefetch_next_segmentation()
+
+    def prefetch_neighbouring_page_images(self):
+        # the pages which are displayed after pressing 'Next' or 'Previous' up to number_of_pages times
+        number_of_pages = self.gui_state.number_of_pages.get()
+        offsets = [number_of_pages + idx for idx in range(number_of_pages)] + [-1 - idx for idx in range(number_of_pages)]
+        self.page_image_prefetcher.prefetch([self.gui_state.image_name_circle.get_nth_from_current(offset)
+                                             for offset in offsets])
+
+    def get_segmentation_mode(self):
+        return {
+            "tiled": self.gui_state.tk_segmentation_tiled.get(),
+            "individual_pages": self.gui_state.tk_segmentation_individual_pages.get(),
+        }
+
+    def prefetch_next_segmentation(self):
+        # the pages which are displayed after pressing 'Next'
+        image_names = [self.gui_state.image_name_circle.get_nth_from_current(idx + 1)
+                       for idx in range(0, self.gui_state.number_of_pages.get())]
+        self.segmentation_prefetcher.prefetch(image_names, self.gui_state.tk_display_images_in_reversed_order.get(),
+                                              self.gui_state.segmentation_weights_path,
+                                              **self.get_segmentation_mode())
+
     def make_new_segmentation(self):
-        def shift_coordinates_by_width(coordinate_list, offset):
-            l = []
-            for element in coordinate_list:
-                l.append(((element[0][0] + offset, element[0][1]), (element[1][0] + offset, element[1][1])))
-            return l
+        if self.segmentation_task is not None and not self.segmentation_task.is_done():
+            return  # only one segmentation at a time
+
+        engine = self.gui_state.segmentation_engine
+        weights_path = self.gui_state.segmentation_weights_path
+        images = self.gui_state.images
+
+        self.segmentation_prefetcher.cancel()  # the prefetched pages are not needed before this segmentation
+
+        task = SegmentationTask(segment_page_images, engine, list(images), weights_path,
+                                **self.get_segmentation_mode())
+        self.segmentation_task = task
+
+        self.gui_state.tk_current_action.set(BoxManipulationAction.NO_ACTION)
+        self.gui_state.tk_is_segmenting.set(True)
+        content = self.piece_properties.content
+        content_version = content.version
 
-        self.piece_properties.content.reset()
+        progress = tk.DoubleVar(self.gui_state.main_window, 0)
 
         def wait(message):
             win = tk.Toplevel()
             win.title('Wait')
-            new_label = tk.Label(win, text=message, padx=10, pady=10)
-            new_label.pack()
+            tk.Label(win, text=message, padx=10, pady=10).pack()
+            tkinter.ttk.Progressbar(win, length=100, orient=tk.HORIZONTAL, variable=progress).pack(pady=10)
+            tk.Button(win, text="Cancel", command=task.cancel).pack(pady=5)
+            win.protocol("WM_DELETE_WINDOW", task.cancel)
             return win
 
-        def segment():
-            if self.gui_state.tk_segmentation_individual_pages.get():
-                current_width_offset = 0
-                boxes = []
-                for img in self.gui_state.images:
-                    current_box = predict_boxes(img, self.gui_state.segmentation_weights_path)
-                    current_box = shift_coordinates_by_width(current_box, current_width_offset)
-                    boxes += current_box
-                    current_width_offset += img.shape[1]
-
-                self.piece_properties.content.create_from_coordinate_list(boxes)
-            else:
-                self.piece_properties.content.create_from_coordinate_list(
-                    predict_boxes(self.gui_state.current_image,
-                                  self.gui_state.segmentation_weights_path))
+        def poll():
+            done, total = task.progress
+            if total:
+                progress.set(100 * done / total)
+
+            if not task.is_done():
+                self.gui_state.main_window.after(50, poll)
+                return
+
+            win.destroy()
+            self.gui_state.tk_is_segmenting.set(False)
+            if task.error is not None:
+                print(f"Segmentation failed. {task.error}")
+            elif task.is_cancelled() or self.gui_state.images is not images:  # the displayed pages have changed
+                pass
+            elif (self.piece_properties.content is not content or content.version != content_version) and \
+                    not askyesno("Overwrite Boxes - Proceed",
+                                 "The boxes have been changed during the segmentation. Replace them by the result of "
+                                 "the segmentation?"):
+                pass
+            else:  # replace the boxes at once, so that the canvas never shows a half finished segmentation
+                boxes = BoxesWithType()
+                boxes.create_from_coordinate_list(task.result)
+                boxes.sort()
+                self.piece_properties.content = boxes
+
+            if self.gui_state.tk_segmentation_prefetch.get():  # resume prefetching the next pages
+                self.prefetch_next_segmentation()
 
         win = wait("Segmentation in progress. Please wait...")
-        self.gui_state.main_window.wait_visibility(win)
-        win.update()
-        segment()
-        self.piece_properties.content.sort()
-        win.destroy()
+        task.start()
+        self.gui_state.main_window.after(50, poll)
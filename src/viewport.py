@@ -0,0 +1,99 @@
+import math
+
+import cv2
+import numpy as np
+
+
+class Viewport:
+    """Pan and zoom state of a canvas window. (x, y) is the image point shown at the top left corner of the window,
+    zoom is the number of window pixels per image pixel."""
+    def __init__(self, width=600, height=600, min_zoom=0.01, max_zoom=8.0):
+        self.x = 0.0
+        self.y = 0.0
+        self.zoom = 1.0
+        self.width = width
+        self.height = height
+        '''Size of the window in pixels'''
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+
+    def get_state(self):
+        return self.x, self.y, self.zoom, self.width, self.height
+
+    def resize(self, width, height):
+        if width > 0 and height > 0:
+            self.width, self.height = width, height
+
+    def fit(self, image_width, image_height):
+        """Shows the whole image, centered in the window."""
+        self.zoom = min(max(min(self.width / image_width, self.height / image_height), self.min_zoom), self.max_zoom)
+        self.x = (image_width - self.width / self.zoom) / 2
+        self.y = (image_height - self.height / self.zoom) / 2
+
+    def zoom_at(self, window_point, factor):
+        """Zooms by factor, keeping the image point below window_point in place."""
+        image_x, image_y = self.x + window_point[0] / self.zoom, self.y + window_point[1] / self.zoom
+        self.zoom = min(max(self.zoom * factor, self.min_zoom), self.max_zoom)
+        self.x, self.y = image_x - window_point[0] / self.zoom, image_y - window_point[1] / self.zoom
+
+    def pan(self, window_dx, window_dy):
+        self.x -= window_dx / self.zoom
+        self.y -= window_dy / self.zoom
+
+    def to_image(self, window_point):
+        return int(math.floor(self.x + window_point[0] / self.zoom)), int(math.floor(self.y + window_point[1] / self.zoom))
+
+    def to_window(self, image_point):
+        return int(round((image_point[0] - self.x) * self.zoom)), int(round((image_point[1] - self.y) * self.zoom))
+
+    def get_visible_rect(self):
+        """Returns the visible part of the image as (x1, y1, x2, y2) in image coordinates."""
+        return (int(math.floor(self.x)), int(math.floor(self.y)),
+                int(math.ceil(self.x + self.width / self.zoom)), int(math.ceil(self.y + self.height / self.zoom)))
+
+
+class PagePyramid:
+    """Image pyramids of the pages of a PageStrip, computed lazily. The pages of level k have 1/2**k of the original
+    resolution, so the canvas never has to resample more pixels than about twice the window size."""
+    def __init__(self, page_strip, min_size=256):
+        self.page_strip = page_strip
+        self.min_size = min_size
+        self.levels = [page_strip.pages]
+        '''list[level] -> list of the downscaled pages'''
+
+    def get_level_index(self, zoom):
+        level = 0
+        largest_size = max(max(page.shape[:2]) for page in self.page_strip.pages)
+        while zoom <= 0.5 ** (level + 1) and largest_size / 2 ** (level + 1) >= self.min_size:
+            level += 1
+        return level
+
+    def get_level(self, level):
+        while len(self.levels) <= level:
+            self.levels.append([cv2.pyrDown(page) for page in self.levels[-1]])
+        return self.levels[level]
+
+
+def render_page_strip(pyramid: PagePyramid, viewport: Viewport, target, background=(128, 128, 128)):
+    """Renders the visible part of the page strip into target, which has the size of the viewport. Only the window
+    pixels are computed, from the pyramid level closest to the zoom."""
+    page_strip = pyramid.page_strip
+    target[:] = background
+    cv2.rectangle(target, viewport.to_window((0, 0)), viewport.to_window((page_strip.width, page_strip.height)),
+                  (255, 255, 255), -1)  # the padding of the pages
+
+    x1, _, x2, _ = viewport.get_visible_rect()
+    level = pyramid.get_level_index(viewport.zoom)
+    level_pages = pyramid.get_level(level)
+    for page_idx in range(page_strip.get_page_index(x1), page_strip.get_page_index(x2) + 1):
+        page, level_page = page_strip.pages[page_idx], level_pages[page_idx]
+        x_offset = page_strip.get_x_offset(page_idx)
+        scale_x, scale_y = level_page.shape[1] / page.shape[1], level_page.shape[0] / page.shape[0]
+        # maps the window pixel (u, v) to the level page pixel, using pixel centers
+        matrix = np.array([
+            [scale_x / viewport.zoom, 0, (0.5 / viewport.zoom + viewport.x - x_offset) * scale_x - 0.5],
+            [0, scale_y / viewport.zoom, (0.5 / viewport.zoom + viewport.y) * scale_y - 0.5],
+        ])
+        cv2.warpAffine(level_page, matrix, (target.shape[1], target.shape[0]), dst=target,
+                       flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_TRANSPARENT)
+    return target
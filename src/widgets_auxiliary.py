@@ -135,6 +135,15 @@ class SelectionFrame:
             button.grid(row=0, column=idx)
             action_buttons.append(button)
 
+        def _on_change_segmentation_state(*args):
+            # the boxes cannot be manipulated while they are segmented in the background
+            is_segmenting = self.program_state.gui_state.tk_is_segmenting.get()
+            for action_button in action_buttons:
+                action_button.config(state="disabled" if is_segmenting else "normal")
+            _on_change_selection_mode()
+
+        self.program_state.gui_state.tk_is_segmenting.trace_add("write", _on_change_segmentation_state)
+
         self.program_state.gui_state.main_window.bind("<Control-n>", lambda x: action_buttons[0].invoke())
         self.program_state.gui_state.main_window.bind("<Control-c>", lambda x: action_buttons[1].invoke())
         self.program_state.gui_state.main_window.bind("<Control-m>", lambda x: action_buttons[2].invoke())
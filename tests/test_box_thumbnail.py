@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from src.auxiliary import get_thumbnail_from_box
+
+
+@pytest.mark.parametrize("box", [((10, 10), (10, 30)), ((10, 10), (30, 10)), ((10, 10), (10, 10)),
+                                 ((500, 500), (520, 520))])
+def test_degenerate_box_gives_empty_thumbnail(box):
+    page_image = np.zeros((100, 100, 3), np.uint8)
+    thumbnail = get_thumbnail_from_box(page_image, box)
+    assert thumbnail.shape == (80, 80, 3)
+    assert (thumbnail == 255).all()
+
+
+def test_thumbnail_is_centered_in_square():
+    page_image = np.zeros((100, 100, 3), np.uint8)
+    thumbnail = get_thumbnail_from_box(page_image, ((0, 0), (20, 10)))
+    assert thumbnail.shape == (80, 80, 3)
+    assert (thumbnail[22:57, 5:75] == 0).all()
+    assert (thumbnail[:22] == 255).all() and (thumbnail[57:] == 255).all()
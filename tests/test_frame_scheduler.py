@@ -0,0 +1,64 @@
+import numpy as np
+
+from src.auxiliary import Colors
+from src.frame_scheduler import FrameScheduler
+from src.overlay import OverlayCompositor
+
+
+class FakeTkWidget:
+    """Records the callbacks scheduled with after() instead of running a Tk event loop."""
+    def __init__(self):
+        self.pending = {}
+        self.next_id = 0
+
+    def after(self, delay, callback):
+        self.next_id += 1
+        self.pending[self.next_id] = (delay, callback)
+        return self.next_id
+
+    def after_cancel(self, callback_id):
+        self.pending.pop(callback_id, None)
+
+    def run_next(self):
+        callback_id = min(self.pending)
+        delay, callback = self.pending.pop(callback_id)
+        callback()
+        return delay
+
+
+def create_ruler_frame(get_mouse_coordinates):
+    base_layer = np.full((200, 200, 3), 255, np.uint8)
+    image = base_layer.copy()
+    overlays = OverlayCompositor()
+
+    def draw_frame():
+        x, y = get_mouse_coordinates()
+        overlays.clear()
+        overlays.add_line((x - 2, y), (x + 60, y), Colors.VIOLET, 1, alpha=0.3)
+        overlays.add_line((x, y - 2), (x, y + 60), Colors.VIOLET, 1, alpha=0.3)
+        return overlays.compose(image, base_layer)
+
+    return draw_frame
+
+
+def test_static_ruler_backs_off_to_idle_interval():
+    widget = FakeTkWidget()
+    scheduler = FrameScheduler(widget, create_ruler_frame(lambda: (50, 50)), max_fps=60, idle_interval=100)
+    scheduler.start()
+    for _ in range(20):
+        widget.run_next()
+
+    assert scheduler.interval == scheduler.idle_interval
+    assert list(widget.pending.values())[0][0] > scheduler.min_interval
+
+
+def test_moving_ruler_keeps_the_frame_rate():
+    widget = FakeTkWidget()
+    positions = iter(range(1000))
+    scheduler = FrameScheduler(widget, create_ruler_frame(lambda: (next(positions) % 150, 50)), max_fps=60,
+                               idle_interval=100)
+    scheduler.start()
+    for _ in range(20):
+        widget.run_next()
+
+    assert scheduler.interval == scheduler.min_interval
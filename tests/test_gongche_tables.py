@@ -0,0 +1,25 @@
+import pytest
+
+from src.plugins.suzipu_lvlvpu_gongchepu.common import (GONGDIAO_MODE_BY_NAME, GongcheMelodySymbol, GongdiaoModeList,
+                                                        Lvlv, PITCH_CONVERSION_TABLE, SUZIPU_TO_INFO,
+                                                        TONE_INVENTORY_TABLE, get_tone_inventory,
+                                                        tone_inventory_convert_pitch)
+
+
+def test_shared_tables_are_read_only():
+    with pytest.raises(TypeError):
+        TONE_INVENTORY_TABLE[Lvlv.HUANGZHONG] = ()
+    with pytest.raises(TypeError):
+        PITCH_CONVERSION_TABLE[Lvlv.HUANGZHONG][GongcheMelodySymbol.HE] = GongcheMelodySymbol.LIU
+    with pytest.raises(TypeError):
+        GONGDIAO_MODE_BY_NAME["Yue Diao"] = None
+    with pytest.raises(TypeError):
+        del SUZIPU_TO_INFO[GongcheMelodySymbol.HE]
+    with pytest.raises(TypeError):
+        get_tone_inventory(Lvlv.HUANGZHONG)[0] = None
+
+
+def test_lookups_are_unchanged():
+    assert GongdiaoModeList.from_string("越调") is GongdiaoModeList.YUE_DIAO
+    assert tone_inventory_convert_pitch(Lvlv.HUANGZHONG, GongcheMelodySymbol.XIA_YI) == GongcheMelodySymbol.YI
+    assert tone_inventory_convert_pitch(Lvlv.HUANGZHONG, None) is None
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+from src.plugins.suzipu_lvlvpu_gongchepu import models
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "HRCenterNet"))
+
+
+def test_quantized_segmentation_model_loads_and_runs(tmp_path):
+    pytest.importorskip("models.HRCenterNet", reason="the HRCenterNet submodule is not checked out")
+    from src.hr_segmentation_adapter import (SegmentationBackend, get_raw_prediction, load_model_with_backend,
+                                             quantize_model, segmentation_net)
+
+    torch.manual_seed(0)
+    weights_path = str(tmp_path / "HRCenterNet.pth.tar")
+    torch.save({"model": segmentation_net().state_dict()}, weights_path)
+
+    rng = np.random.default_rng(0)
+    calibration_images = [rng.integers(0, 256, (600, 400, 3), dtype=np.uint8) for _ in range(2)]
+    quantized_path = quantize_model(weights_path, calibration_images)
+    assert os.path.isfile(quantized_path)
+
+    quantized_model = load_model_with_backend(weights_path, SegmentationBackend.QUANTIZED)
+    assert isinstance(quantized_model, torch.jit.ScriptModule)  # not the eager fallback
+
+    eager_model = load_model_with_backend(weights_path, SegmentationBackend.EAGER).to("cpu").eval()
+    quantized_prediction = get_raw_prediction(calibration_images[0], quantized_model)
+    eager_prediction = get_raw_prediction(calibration_images[0], eager_model)
+    assert quantized_prediction.shape == eager_prediction.shape
+    assert torch.isfinite(quantized_prediction).all()
+
+
+def test_quantized_classifier_loads_without_observer_warnings(tmp_path, recwarn, monkeypatch):
+    monkeypatch.setattr(models, "USE_QUANTIZED_MODELS", True)
+    torch.manual_seed(0)
+    weights_path = str(tmp_path / "classifier.pt")
+    model = models.TemperatureScalingCalibrationModule(models.CnnModel(num_classes=5)).eval()
+    torch.save(model.state_dict(), weights_path)
+    models.quantize_model(model.model, torch.rand(8, 1, 48, 48))
+    torch.save(model.state_dict(), models.get_quantized_weights_path(weights_path))
+
+    recwarn.clear()
+    loaded_model = models.load_cnn_model(5, weights_path)
+    assert not [w for w in recwarn if "must run observer" in str(w.message)]
+
+    images = torch.rand(4, 1, 48, 48)
+    with torch.no_grad():
+        assert torch.equal(loaded_model(images), model(images))
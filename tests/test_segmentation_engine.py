@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "HRCenterNet"))
+pytest.importorskip("models.HRCenterNet", reason="the HRCenterNet submodule is not checked out")
+
+from src.hr_segmentation_adapter import (SegmentationBackend, SegmentationCache, SegmentationEngine, export_model,
+                                         segmentation_net)
+
+
+@pytest.fixture
+def weights_path(tmp_path):
+    torch.manual_seed(0)
+    path = str(tmp_path / "HRCenterNet.pth.tar")
+    torch.save({"model": segmentation_net().state_dict()}, path)
+    return path
+
+
+def touch_newer(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_re_exported_model_is_reloaded(weights_path):
+    engine = SegmentationEngine(backend=SegmentationBackend.TORCHSCRIPT)
+    torchscript_path = export_model(weights_path)[0]
+    first_model = engine.get_model(weights_path)
+    assert engine.get_model(weights_path) is first_model
+
+    export_model(weights_path)
+    touch_newer(torchscript_path)
+    assert engine.get_model(weights_path) is not first_model
+    assert len(engine.models) == 1
+
+
+def test_eager_fallback_is_cached_as_eager(weights_path, tmp_path):
+    torchscript_path = export_model(weights_path)[0]
+    with open(torchscript_path, "wb") as file_handle:
+        file_handle.write(b"not a TorchScript archive")
+    touch_newer(torchscript_path)
+
+    cache = SegmentationCache(cache_dir=str(tmp_path / "cache"))
+    image = np.zeros((64, 48, 3), np.uint8)
+    engine = SegmentationEngine(cache=cache, backend=SegmentationBackend.TORCHSCRIPT)
+    eager_engine = SegmentationEngine(cache=cache, backend=SegmentationBackend.EAGER)
+
+    assert engine.load(weights_path)[1] == SegmentationBackend.EAGER
+    assert engine.get_cache_key(image, weights_path) == eager_engine.get_cache_key(image, weights_path)
+
+
+class CancelAfter:
+    """Cancel event that becomes set after it was checked a number of times."""
+    def __init__(self, number_of_checks):
+        self.remaining_checks = number_of_checks
+
+    def is_set(self):
+        self.remaining_checks -= 1
+        return self.remaining_checks < 0
+
+
+@pytest.mark.parametrize("tiled", [False, True])
+def test_cancellation_stops_between_pages(weights_path, tmp_path, tiled, monkeypatch):
+    import src.hr_segmentation_adapter as hr_segmentation_adapter
+
+    segmented_pages = []
+    get_raw_predictions = hr_segmentation_adapter.get_raw_predictions
+    monkeypatch.setattr(hr_segmentation_adapter, "get_raw_predictions",
+                        lambda batch, model: segmented_pages.append(len(batch)) or get_raw_predictions(batch, model))
+
+    engine = SegmentationEngine(cache=SegmentationCache(cache_dir=str(tmp_path / "cache")),
+                                backend=SegmentationBackend.EAGER)
+    pages = [np.zeros((600, 400, 3), np.uint8) for _ in range(4)]
+    with pytest.raises(hr_segmentation_adapter.SegmentationCancelled):
+        engine.predict_pages(pages, weights_path, tiled=tiled, cancel_event=CancelAfter(2))
+    assert not segmented_pages  # cancelled while the pages were hashed, before any forward pass